@@ -2,6 +2,7 @@ import argparse
 
 from src.game import play
 from src.experiments import run
+from src.experiments.benchmark import benchmark
 
 parser = argparse.ArgumentParser(description='placeholder')
 
@@ -10,6 +11,11 @@ parser.add_argument(
     action='store_true', 
     help='run all experiments.'
 )
+parser.add_argument(
+    '-b', '--benchmark', 
+    action='store_true', 
+    help='Measure move time and search throughput for the given board size.'
+)
 parser.add_argument(
     '-p', '--play' ,
     action='store_true', 
@@ -28,6 +34,14 @@ parser.add_argument(
         'transposition tables and iterative deepening.'
     )
 )
+parser.add_argument(
+    '-mtdf', '--alpha-beta-mtdf' ,
+    action='store_true', 
+    help=(
+        'Play against Robot using MTD(f) with transposition tables and '
+        'iterative deepening.'
+    )
+)
 parser.add_argument(
     '-mcts', '--monte-carlo-tree-search' ,
     action='store_true', 
@@ -37,7 +51,7 @@ parser.add_argument(
     '-s', '--board-size' ,
     default=5,
     type=int,
-    help='Board size (max 9).'
+    help='Board size.'
 )
 parser.add_argument(
     '-d', '--depth' ,
@@ -63,6 +77,12 @@ parser.add_argument(
     type=int,
     help='Maximum iterations of MCTS.'
 )
+parser.add_argument(
+    '-k', '--batch-size' ,
+    default=1,
+    type=int,
+    help='Number of MCTS rollouts per iteration, run at once.'
+)
 
 
 
@@ -73,11 +93,16 @@ if __name__ == '__main__':
     if args.run_experiments:
         run.all_experiments()
 
+    elif args.benchmark:
+        benchmark(board_sizes=[args.board_size], maxtime=args.time)
+
     elif args.play:
         if args.alpha_beta:
             algorithm = 'alpha-beta'
         elif args.alpha_beta_transposition_table:
             algorithm = 'alpha-beta-iterative-deepening'
+        elif args.alpha_beta_mtdf:
+            algorithm = 'alpha-beta-mtdf'
         elif args.monte_carlo_tree_search:
             algorithm = 'mcts'
         else:
@@ -88,7 +113,8 @@ if __name__ == '__main__':
             'maxdepth': args.depth,
             'maxtime': args.time,
             'cp': args.cp,
-            'maxiter': args.max_iterations
+            'maxiter': args.max_iterations,
+            'batch_size': args.batch_size
         }
 
-        play(algorithm, min(args.board_size, 9), kwargs)
\ No newline at end of file
+        play(algorithm, args.board_size, kwargs)
\ No newline at end of file
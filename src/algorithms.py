@@ -1,15 +1,29 @@
-import copy
+from collections import deque
+import random
 import sys
 import time
 
 import numpy as np
-
-from src.utils import Node
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from src.batch import HexBoardBatch
+from src.geometry import HexGeometry, BLUE, RED
+from src.transposition import (
+    TranspositionTable, LEAF, LOWERBOUND, UPPERBOUND
+)
+from src.utils import (
+    SearchTree, EvaluationCache, SearchLimits, SearchAborted
+)
 
 def dijkstra(board, player):
     """Dijkstra algorithm to find shortest path on a Hex board for a given 
     palyer.
 
+    Entering an empty cell costs 1 and entering a cell of the player costs 0,
+    so the search is implemented as a 0-1 BFS with a deque instead of a 
+    priority queue.
+
     Args:
         board (obj): game.HexBoard object
         player (int): value of player on board
@@ -18,54 +32,47 @@ def dijkstra(board, player):
         ValueError: Unkown player value
 
     Returns:
-        int: Length of shortest path
+        int: Length of shortest path, None if there is no path.
     """
     if player == board.BLUE:
-        initial = (0, -sys.maxsize)
-        endstate = [(i, board.size-1) for i in range(board.size)]
         opponent = board.RED
     elif player == board.RED:
-        initial = (-sys.maxsize, 0)
-        endstate = [(board.size-1, i) for i in range(board.size)]
         opponent = board.BLUE
     else:
         raise ValueError('Unkown player value {}'.format(player))
 
-    visited = {}
-    queue = {initial: 0}
+    geometry = board.geometry
+    adjacency = geometry.adjacency[player]
+    n_cells = geometry.n_cells
+    cells = board.cells
+    source, sink = geometry.edge_nodes[player]
 
+    dist = [sys.maxsize]*geometry.n_nodes
+    dist[source] = 0
+    done = [False]*geometry.n_nodes
+    queue = deque([source])
     while queue:
-        state = min(queue, key=queue.get)
-
-        if state in endstate:
-            return queue[state]
-
-        neighbors = board.get_neighbors(state)
-
-        for n in neighbors:
-
-            if n in visited:
-                continue
-            if board.board[n] == opponent:
-                continue
-
-            if board.board[n] == player:
-                score = queue[state]
-            else:
-                score = queue[state] + 1
-
-            if n in queue:
-                if queue[n] > score:
-                    queue[n] = score
-                # else: new value higher than queued value
-            else:  # n not in queue
-                queue[n] = score
-
-        visited[state] = queue[state]
-        del queue[state]
-
-
-def shortest_path_heuristic(board, player, opponent):
+        node = queue.popleft()
+        if done[node]:
+            continue
+        done[node] = True
+
+        d = dist[node]
+        if node == sink:
+            return d
+
+        for n in adjacency[node]:
+            # Own stones and the virtual edge nodes are free to enter.
+            if n >= n_cells or cells[n] == player:
+                if d < dist[n]:
+                    dist[n] = d
+                    queue.appendleft(n)
+            elif cells[n] != opponent and d + 1 < dist[n]:
+                dist[n] = d + 1
+                queue.append(n)
+
+
+def shortest_path_heuristic(board, player, opponent, incremental=False):
     """Calculate shortest paht heuristice for a given board state given two 
     players. A bonus point is added to winning states.
 
@@ -73,12 +80,22 @@ def shortest_path_heuristic(board, player, opponent):
         board (obj): game.HexBoard object
         player (int): value of player on board
         opponent (int): value of opponent on board
+        incremental (bool, optional): if true, read the shortest paths from
+            the distance maps attached to the board, which are repaired on 
+            every move instead of recomputed. The engines attach them to the
+            searched position, see `uses_distance_maps`. Without attached 
+            maps the paths are computed as usual. Defaults to False.
 
     Returns:
         int: board heuristic reward
     """
-    shortest_path_player = dijkstra(board, player)
-    shortest_path_opponent = dijkstra(board, opponent)
+    distance_maps = board.distance_maps
+    if incremental and distance_maps is not None:
+        shortest_path_player = distance_maps.shortest_path(player)
+        shortest_path_opponent = distance_maps.shortest_path(opponent)
+    else:
+        shortest_path_player = dijkstra(board, player)
+        shortest_path_opponent = dijkstra(board, opponent)
 
     if shortest_path_player == 0:  # player wins
         return board.size+1
@@ -88,21 +105,406 @@ def shortest_path_heuristic(board, player, opponent):
     return -(shortest_path_player - shortest_path_opponent)
 
 
+def incremental_shortest_path_heuristic(board, player, opponent):
+    """Shortest path heuristic using distance maps kept on the board, see 
+    `shortest_path_heuristic`.
+    """
+    return shortest_path_heuristic(board, player, opponent, incremental=True)
+
+incremental_shortest_path_heuristic.uses_distance_maps = True
+
+
+def uses_distance_maps(heuristic, ordering=None):
+    """Check whether a heuristic or move ordering reads the distance maps of
+    the board. Heuristics mark this with a `uses_distance_maps` attribute. 
+    The engines then attach maps to the searched position for the duration
+    of a search, so the game board does not keep updating them.
+    """
+    if isinstance(heuristic, EvaluationCache):
+        heuristic = heuristic.heuristic
+    return (
+        getattr(heuristic, 'uses_distance_maps', False) or
+        (ordering is not None and ordering.use_distance)
+    )
+
+
 def random_heuristic(board):
     return np.random.randint(2*board.size) - board.size
 
+
+class SparseShortestPathHeuristic:
+    """Shortest path heuristic computed with `scipy.sparse.csgraph`.
+
+    Gives the same scores as `shortest_path_heuristic`, but the shortest paths
+    of both players are found in one call outside the interpreter loop. Many 
+    positions, for example all children of a node, can be evaluated at once 
+    with `evaluate` and `evaluate_children`, which put the graphs of all 
+    positions in one block diagonal sparse matrix.
+
+    Every position has a block with the adjacency graph of BLUE followed by 
+    that of RED. The graph is directed and the weight of an edge is the cost
+    of entering its target: 1 for an empty cell and `eps` for an own stone or
+    virtual edge node, as csgraph ignores zero weights. Entering a cell of 
+    the opponent costs `blocked`, longer than any real path, so the structure
+    of the graph is the same for every position. It is built once per board 
+    size and only the weights are filled in per evaluation.
+    """
+    eps = 1e-6
+
+    # Graph structures per board size, see `get_graph`.
+    _graphs = {}
+
+    def __init__(self):
+        # (board size, key) and distance maps, see `edge_distances`.
+        self._last_distances = None
+
+    def __call__(self, board, player, opponent):
+        cells = np.frombuffer(board.cells, dtype=np.int8)[None]
+        return int(self.evaluate(cells, board.size, player, opponent)[0])
+
+    def get_graph(self, size, n_positions):
+        """Return the (cached) structure of the block diagonal graph of 
+        `n_positions` positions as (targets, indices, indptr). `targets` are 
+        the targets of the edges of one block, in CSR order. `indices` and 
+        `indptr` describe the whole matrix. They are kept for the largest 
+        number of positions seen so far, the first blocks of a larger matrix
+        form a smaller one.
+        """
+        graph = self._graphs.get(size)
+        if graph is None or graph[0] < n_positions:
+            geometry = HexGeometry.get(size)
+            n_nodes = geometry.n_nodes
+            sources, targets = [], []
+            for block, color in enumerate((BLUE, RED)):
+                for u, nodes in enumerate(geometry.adjacency[color]):
+                    for v in nodes:
+                        sources.append(block*n_nodes + u)
+                        targets.append(block*n_nodes + v)
+            sources = np.array(sources)
+            targets = np.array(targets)
+
+            capacity = max(n_positions, 2*graph[0] if graph else 1)
+            block_size = 2*n_nodes
+            offset = (np.arange(capacity)*block_size)[:, None]
+            indices = (targets + offset).ravel()
+            degree = np.bincount(sources, minlength=block_size)
+            indptr = np.concatenate(
+                ([0], np.cumsum(np.tile(degree, capacity)))
+            )
+            graph = self._graphs[size] = (capacity, targets, indices, indptr)
+
+        _, targets, indices, indptr = graph
+        n_edges = len(targets)
+        block_size = 2*HexGeometry.get(size).n_nodes
+        return (
+            targets, indices[:n_positions*n_edges], 
+            indptr[:n_positions*block_size + 1]
+        )
+
+    def build_graph(self, cells, size):
+        """Build the block diagonal graph of a batch of positions, see the
+        class description.
+
+        Args:
+            cells (array): (K, size*size) array of color values
+            size (int): size of the boards
+
+        Returns:
+            obj: scipy.sparse.csr_matrix with 2*n_nodes nodes per position
+        """
+        geometry = HexGeometry.get(size)
+        n_nodes = geometry.n_nodes
+        n_cells = geometry.n_cells
+        n_positions = len(cells)
+        block_size = 2*n_nodes
+        targets, indices, indptr = self.get_graph(size, n_positions)
+
+        # Cost of entering every node, per position.
+        cost = np.full((n_positions, block_size), self.eps)
+        for block, (color, opponent) in enumerate(((BLUE, RED), (RED, BLUE))):
+            cost[:, block*n_nodes:block*n_nodes + n_cells] = np.where(
+                cells == color, self.eps,
+                np.where(cells == opponent, block_size, 1)
+            )
+        return sparse.csr_matrix(
+            (cost[:, targets].ravel(), indices, indptr),
+            shape=(n_positions*block_size, n_positions*block_size)
+        )
+
+    def read_distances(self, dist, size):
+        """Round distances from the graph to path lengths, paths through 
+        blocked cells become inf.
+        """
+        dist = np.rint(dist)
+        dist[dist >= 2*HexGeometry.get(size).n_nodes] = np.inf
+        return dist
+
+    def shortest_paths(self, cells, size):
+        """Calculate the shortest paths of both colors for a batch of 
+        positions.
+
+        Args:
+            cells (array): (K, size*size) array of color values
+            size (int): size of the boards
+
+        Returns:
+            dict: color -> (K,) float array of path lengths, inf if there is
+                no path
+        """
+        geometry = HexGeometry.get(size)
+        n_nodes = geometry.n_nodes
+        graph = self.build_graph(cells, size)
+
+        offset = np.arange(len(cells))*2*n_nodes
+        sources = []
+        sinks = []
+        for block, color in enumerate((BLUE, RED)):
+            source, sink = geometry.edge_nodes[color]
+            sources.append(block*n_nodes + source + offset)
+            sinks.append(block*n_nodes + sink + offset)
+        # The blocks are not connected, so the minimum over all sources is the
+        # distance from the source of the own block.
+        dist = csgraph.dijkstra(
+            graph, indices=np.concatenate(sources), min_only=True
+        )
+        return {
+            color: self.read_distances(dist[sink], size)
+            for color, sink in zip((BLUE, RED), sinks)
+        }
+
+    def score(self, shortest_path_player, shortest_path_opponent, size):
+        """Return the int array of heuristic rewards for arrays of shortest
+        path lengths, see `shortest_path_heuristic`.
+        """
+        with np.errstate(invalid='ignore'):
+            score = -(shortest_path_player - shortest_path_opponent)
+        score[shortest_path_opponent == 0] = -(size+1)
+        score[shortest_path_player == 0] = size+1
+        return score.astype(int)
+
+    def evaluate(self, cells, size, player, opponent):
+        """Evaluate a batch of positions.
+
+        Args:
+            cells (array): (K, size*size) array of color values
+            size (int): size of the boards
+            player (int): value of player on board
+            opponent (int): value of opponent on board
+
+        Returns:
+            array: (K,) int array of board heuristic rewards
+        """
+        paths = self.shortest_paths(cells, size)
+        return self.score(paths[player], paths[opponent], size)
+
+    def edge_distances(self, board):
+        """Return the distance maps of a board as a dict color -> (distances
+        from the source edge to every cell, distances from the sink edge to 
+        every cell, shortest path). The maps of the last board are kept, so 
+        the batches of children of one node share them.
+        """
+        key = (board.size, board.key)
+        if self._last_distances is not None and self._last_distances[0] == key:
+            return self._last_distances[1]
+
+        size = board.size
+        geometry = board.geometry
+        n_nodes = geometry.n_nodes
+        n_cells = geometry.n_cells
+        cells = np.frombuffer(board.cells, dtype=np.int8)
+
+        roots = []
+        for block, color in enumerate((BLUE, RED)):
+            roots.extend(
+                block*n_nodes + node for node in geometry.edge_nodes[color]
+            )
+        graph = self.build_graph(cells[None], size)
+        dist = self.read_distances(
+            csgraph.dijkstra(graph, indices=roots), size
+        )
+
+        distances = {}
+        for block, color in enumerate((BLUE, RED)):
+            nodes = slice(block*n_nodes, block*n_nodes + n_cells)
+            sink = block*n_nodes + geometry.edge_nodes[color][1]
+            from_source, from_sink = dist[2*block], dist[2*block + 1]
+            distances[color] = (
+                from_source[nodes], from_sink[nodes], from_source[sink]
+            )
+        self._last_distances = (key, distances)
+        return distances
+
+    def evaluate_children(self, board, moves, color, player, opponent):
+        """Evaluate all positions reached by playing one of `moves` with 
+        `color` on `board`.
+
+        The children are derived from the distance maps of the board, the 
+        distances from both edges of both colors to every cell. A stone of 
+        `color` on a cell only shortens the paths through that cell by one, 
+        so the new shortest path of `color` follows directly. For the other
+        color the cell becomes blocked, which only changes its shortest path
+        when the cell lies on one of its shortest paths. Only those children 
+        are searched, in one batch.
+
+        Returns:
+            array: (len(moves),) int array of board heuristic rewards
+        """
+        size = board.size
+        other = RED if color == BLUE else BLUE
+        cells = np.frombuffer(board.cells, dtype=np.int8)
+        index = np.array([y*size + x for y, x in moves], dtype=int)
+
+        paths = {}
+        through = {}
+        for map_color, (from_source, from_sink, path) in (
+            self.edge_distances(board).items()
+        ):
+            paths[map_color] = path
+            # Shortest path through each of the empty cells of the moves.
+            through[map_color] = from_source[index] + from_sink[index] - 1
+
+        children = {
+            color: np.minimum(paths[color], through[color] - 1),
+            other: np.full(len(moves), paths[other]),
+        }
+        on_path = through[other] <= paths[other]
+        if on_path.any():
+            child_cells = np.tile(cells, (np.count_nonzero(on_path), 1))
+            child_cells[
+                np.arange(len(child_cells)), index[on_path]
+            ] = color
+            children[other][on_path] = self.shortest_paths(
+                child_cells, size
+            )[other]
+        return self.score(children[player], children[opponent], size)
+
+def restore_board(board, history_length):
+    """Undo the moves played on a board after a search was aborted."""
+    while len(board.history) > history_length:
+        board.undo()
+
+def frontier_scores(heuristic, board, moves, color, player, opponent, 
+                    batch_size):
+    """Yield the heuristic scores of the children reached by playing each of
+    `moves` with `color`. The children are evaluated in batches of 
+    `batch_size` with one `heuristic.evaluate_children` call, a batch is only
+    evaluated when its first score is requested. So a search that stops at a 
+    cutoff skips the remaining batches.
+    """
+    for start in range(0, len(moves), batch_size):
+        scores = heuristic.evaluate_children(
+            board, moves[start:start+batch_size], color, 
+            player=player, opponent=opponent
+        )
+        for score in scores:
+            yield int(score)
+
 class AlphaBeta:
     """Alpha Beta pruning engine for Hex. Search methods finds the best move 
     according to a given heuristic. Default heuristic is Dijkstra shortest path 
     heuristic.
     """
-    def __init__(self, heuristic = shortest_path_heuristic):
+    def __init__(self, heuristic = shortest_path_heuristic, 
+                 frontier_batch=None, ordering=None, limits=None):
+        """
+        Args:
+            heuristic (func, optional): Heuristic function. Defaults to 
+                shortest_path_heuristic.
+            frontier_batch (int, optional): If set and the heuristic has an
+                `evaluate_children` method, the children of nodes at depth 1
+                are evaluated in batches of this size, see `search_frontier`.
+                Defaults to None.
+            ordering (obj, optional): ordering.MoveOrdering object. If None, 
+                moves are searched in the order of the board move list. 
+                Defaults to None.
+            limits (obj, optional): utils.SearchLimits checked at every node
+                during `iterative_deepening`. Direct calls to `search` are not
+                limited. Defaults to None (no limits).
+        """
         self.nodes_searched = 0
         self.cutoffs = 0
         self.heuristic = heuristic
+        self.frontier_batch = frontier_batch
+        self.ordering = ordering
+        self.limits = limits
+        # Limits checked by `search`, only set during iterative deepening.
+        self.active_limits = None
+        self.search_depth = 0
+        self.use_distance_maps = uses_distance_maps(heuristic, ordering)
 
     def reset(self):
-        self.__init__(heuristic=self.heuristic)
+        if isinstance(self.heuristic, EvaluationCache):
+            self.heuristic.reset()
+        if self.ordering is not None:
+            self.ordering.reset()
+        self.__init__(
+            heuristic=self.heuristic, 
+            frontier_batch=self.frontier_batch,
+            ordering=self.ordering,
+            limits=self.limits
+        )
+
+    def get_moves(self, board, color, opponent):
+        """Return the moves of a node in search order."""
+        moves = board.get_move_list()
+        if self.ordering is not None:
+            moves = self.ordering.order(board, moves, color, opponent)
+        return moves
+
+    def register_cutoff(self, board, move, color, depth):
+        """Count a cutoff caused by `move` and update the move ordering."""
+        self.cutoffs += 1
+        if self.ordering is not None:
+            self.ordering.update(board, move, color, depth)
+
+    def use_frontier(self):
+        """Check whether children of depth 1 nodes are evaluated in batches.
+        """
+        return (
+            self.frontier_batch is not None and 
+            hasattr(self.heuristic, 'evaluate_children')
+        )
+
+    def search_frontier(self, board, player, opponent, maximize, alpha, 
+                        beta):
+        """Search a node at depth 1 by evaluating its children in batches.
+        Gives the same result as `search`: batches are scanned in move order
+        with the same cutoffs, later batches are skipped after a cutoff.
+
+        Returns:
+            (tuple, int): bestmove and score 
+        """
+        best_move = None
+        color, other = (player, opponent) if maximize else (opponent, player)
+        g = -sys.maxsize if maximize else sys.maxsize
+        moves = self.get_moves(board, color, other)
+        scores = frontier_scores(
+            self.heuristic, board, moves, color, player, opponent, 
+            self.frontier_batch
+        )
+        for move, score in zip(moves, scores):
+            self.nodes_searched += 1
+
+            if maximize:
+                if score > g:
+                    g = score
+                    best_move = move
+                if g >= beta:
+                    self.register_cutoff(board, move, color, 1)
+                    break
+                if g > alpha:
+                    alpha = g
+            else:
+                if score < g:
+                    g = score
+                    best_move = move
+                if g <= alpha:
+                    self.register_cutoff(board, move, color, 1)
+                    break
+                if g < beta:
+                    beta = g
+
+        return best_move, g
 
     def search(self, board, player, opponent, maximize=True, depth=3,
                alpha=-sys.maxsize, beta=sys.maxsize):
@@ -121,10 +523,22 @@ class AlphaBeta:
         Returns:
             (tuple, int): bestmove and score 
         """
+        if self.use_distance_maps and board.distance_maps is None:
+            # Attach distance maps for this search only.
+            board.enable_distance_maps()
+            try:
+                return self.search(
+                    board, player, opponent, maximize, depth, alpha, beta
+                )
+            finally:
+                board.disable_distance_maps()
+
         # TODO: move this check outside method
-        if len(board.get_move_list()) < depth:
-            depth = len(board.get_move_list())
+        if board.get_move_count() < depth:
+            depth = board.get_move_count()
 
+        if self.active_limits is not None:
+            self.active_limits.check()
         self.nodes_searched += 1
         best_move = None
 
@@ -132,28 +546,35 @@ class AlphaBeta:
             score = self.heuristic(board, player=player, opponent=opponent)
             return (None, score)
 
+        if depth == 1 and self.use_frontier():
+            return self.search_frontier(
+                board, player, opponent, maximize, alpha, beta
+            )
+
         if maximize:
             g = -sys.maxsize
-            for move in board.get_move_list():
-                board_hyp = copy.deepcopy(board)
-                board_hyp.set_piece(move, player)
-
-                _, score = self.search(
-                    board_hyp, 
-                    player, 
-                    opponent, 
-                    maximize=False,
-                    depth=depth-1, 
-                    alpha=alpha, 
-                    beta=beta
-                )
+            for move in self.get_moves(board, player, opponent):
+                board.play(move, player)
+                # The move is also undone when the search is aborted.
+                try:
+                    _, score = self.search(
+                        board, 
+                        player, 
+                        opponent, 
+                        maximize=False,
+                        depth=depth-1, 
+                        alpha=alpha, 
+                        beta=beta
+                    )
+                finally:
+                    board.undo()
 
                 if score > g:
                     g = score
                     best_move = move
 
                 if g >= beta:
-                    self.cutoffs += 1
+                    self.register_cutoff(board, move, player, depth)
                     break
 
                 if g > alpha:
@@ -161,32 +582,72 @@ class AlphaBeta:
 
         else:  # Minimize
             g = sys.maxsize
-            for move in board.get_move_list():
-                board_hyp = copy.deepcopy(board)
-                board_hyp.set_piece(move, opponent)
-
-                _, score = self.search(
-                    board_hyp, 
-                    player, 
-                    opponent, 
-                    maximize=True,
-                    depth=depth-1, 
-                    alpha=alpha, 
-                    beta=beta
-                )
+            for move in self.get_moves(board, opponent, player):
+                board.play(move, opponent)
+                try:
+                    _, score = self.search(
+                        board, 
+                        player, 
+                        opponent, 
+                        maximize=True,
+                        depth=depth-1, 
+                        alpha=alpha, 
+                        beta=beta
+                    )
+                finally:
+                    board.undo()
 
                 if score < g:
                     g = score
                     best_move = move
 
                 if g <= alpha:
-                    self.cutoffs += 1
+                    self.register_cutoff(board, move, opponent, depth)
                     break
 
                 if g < beta:
                     beta = g
 
         return best_move, g
+
+    def iterative_deepening(self, board, player, opponent, depth=3):
+        """Search the board at depth 1 up to `depth` within the limits. When 
+        the limits are exceeded, the search is aborted and the result of the
+        deepest completed search is returned. If no depth completed, the first
+        move of the move list is returned with score None.
+
+        Args:
+            board (obj): game.HexBoard object
+            player (int): value of player on board
+            opponent (int): value of opponent on board
+            depth (int, optional): maximum search depth. Defaults to 3.
+
+        Returns:
+            (tuple, int): best move and score 
+        """
+        if self.limits is None:
+            self.limits = SearchLimits()
+        self.limits.start()
+        history_length = len(board.history)
+
+        best_move = self.get_moves(board, player, opponent)[0]
+        g = None
+        self.search_depth = 0
+        for d in range(1, min(depth, board.get_move_count()) + 1):
+            self.active_limits = self.limits
+            try:
+                best_move, g = self.search(board, player, opponent, depth=d)
+            except SearchAborted:
+                restore_board(board, history_length)
+                break
+            finally:
+                self.active_limits = None
+            self.search_depth = d
+            self.limits.iteration()
+            if self.limits.exceeded():
+                break
+        
+        return best_move, g
     
     def print_summary(self):
         """print summary of search.
@@ -197,13 +658,17 @@ class AlphaBeta:
             '-----------------------------------------------------'+'\n'
             'Nodes searched:              | {nodes_searched}\n'
             'Alpha-Beta pruning cutoffs:  | {cutoffs}\n'
-            '-----------------------------------------------------'+'\n'
         )
+        if isinstance(self.heuristic, EvaluationCache):
+            summary_txt += 'Evaluation cache hits/misses:| {hits}/{misses}\n'
+        summary_txt += '-----------------------------------------------------\n'
         
         print(
             summary_txt.format(
                 nodes_searched=self.nodes_searched,
                 cutoffs=self.cutoffs,
+                hits=getattr(self.heuristic, 'hits', 0),
+                misses=getattr(self.heuristic, 'misses', 0),
             )
         )
 
@@ -211,7 +676,10 @@ class TranspositionTablesAlphaBeta:
     """Enhanced AlphaBeta class with transpostion tables and iterative 
     deepening.
     """
-    def __init__(self, heuristic=shortest_path_heuristic, maxtime=5, maxdepth=9):
+    def __init__(self, heuristic=shortest_path_heuristic, maxtime=5, maxdepth=9,
+                 frontier_batch=None, pvs=False, aspiration_window=None,
+                 ordering=None, tt_size=2**18, tt=None, limits=None, 
+                 mtdf=False):
         """
         Args:
             heuristic (func, optional): Heuristic function. Defaults to 
@@ -220,44 +688,106 @@ class TranspositionTablesAlphaBeta:
                 Defaults to 5.
             maxdepth (int, optional): mac depth iterative deepening. Defaults to 
                 9.
+            frontier_batch (int, optional): If set and the heuristic has an
+                `evaluate_children` method, the children of nodes at depth 1
+                are evaluated in batches of this size. Defaults to None.
+            pvs (bool, optional): Use Principal Variation Search: moves after
+                the first are searched with a null window, and only searched
+                again with the full window when they turn out to be better. 
+                Defaults to False.
+            aspiration_window (int, optional): If set, iterative deepening 
+                searches each depth with a window of this half width around 
+                the score of the previous depth, and searches again with an 
+                open bound when the score falls outside. Defaults to None.
+            ordering (obj, optional): ordering.MoveOrdering object. If None, 
+                only the best line from the transposition table is moved to 
+                the front, see `move_ordering`. Defaults to None.
+            tt_size (int, optional): Number of entries of the transposition 
+                table. Defaults to 2**18 (4 MB).
+            tt (obj, optional): transposition.TranspositionTable object to 
+                use instead of a new table of `tt_size`, e.g. a table in 
+                shared memory. Defaults to None.
+            limits (obj, optional): utils.SearchLimits checked at every node
+                while deepening, see `deepen`. Direct calls to `search` are 
+                not limited. Defaults to None, which limits iterative 
+                deepening to `maxtime`.
+            mtdf (bool, optional): Search every depth of iterative deepening
+                with MTD(f) instead of a single (aspiration) window search, 
+                see `search_mtdf`. Defaults to False.
         """
         self.heuristic = heuristic
         self.maxtime = maxtime
         self.maxdepth = maxdepth
+        self.frontier_batch = frontier_batch
+        self.pvs = pvs
+        self.aspiration_window = aspiration_window
+        self.ordering = ordering
+        self.mtdf = mtdf
         
-        self.tt = {} # Transposition table
+        # Transposition table, kept between moves.
+        self.tt = tt if tt is not None else TranspositionTable(tt_size)
+        if limits is None:
+            limits = SearchLimits(maxtime=maxtime)
+        self.limits = limits
+        # Limits checked by `search`, only set while deepening.
+        self.active_limits = None
+        self.use_distance_maps = uses_distance_maps(heuristic, ordering)
+        self.aborted = False
         self.cutoffs = 0
         self.nodes_searched = 0
         self.tt_lookups = 0
+        self.researches = 0
+        self.aspiration_researches = 0
+        self.mtdf_passes = 0
+        self.nodes_per_depth = []
         self.search_depth = 1
 
     def reset(self):
-        self.__init__(
-            heuristic=self.heuristic, 
-            maxtime=self.maxtime, 
-            maxdepth=self.maxdepth
+        """Reset the statistics for the search of a next move. The 
+        transposition table is kept, its entries age by one generation.
+        """
+        if isinstance(self.heuristic, EvaluationCache):
+            self.heuristic.reset()
+        if self.ordering is not None:
+            self.ordering.reset()
+        self.tt.new_search()
+        self.aborted = False
+        self.cutoffs = 0
+        self.nodes_searched = 0
+        self.tt_lookups = 0
+        self.researches = 0
+        self.aspiration_researches = 0
+        self.mtdf_passes = 0
+        self.nodes_per_depth = []
+        self.search_depth = 1
+
+    def use_frontier(self):
+        """Check whether children of depth 1 nodes are evaluated in batches.
+        """
+        return (
+            self.frontier_batch is not None and 
+            hasattr(self.heuristic, 'evaluate_children')
         )
 
-    def lookup(self, board, depth, alpha, beta):
+    def lookup(self, state_key, depth, alpha, beta):
         """ Look up a board state in the transpostion table and return whether 
         move found, the score of the state and the move to take in that state.
         """
-        state_key = board.hash_state()
+        entry = self.tt.get(state_key)
 
-        if state_key not in self.tt.keys():
+        if entry is None:
             return False, None, []
 
-        move, state_depth, g, state = self.tt[state_key]
+        move, state_depth, g, state = entry
+        move = [] if move is None else [move]
 
         hit = False
-        if state_depth < depth:
-            hit = True
-        elif state_depth >= depth:
-            if state == 'LEAF':
+        if state_depth >= depth:
+            if state == LEAF:
                 hit = True
-            elif state == 'LOWERBOUND' and g >= beta:
+            elif state == LOWERBOUND and g >= beta:
                 hit = True
-            elif state == 'UPERBOUND' and g <= alpha:
+            elif state == UPPERBOUND and g <= alpha:
                 hit = True
 
         if hit:
@@ -265,32 +795,107 @@ class TranspositionTablesAlphaBeta:
         else:
             return False, None, move
 
-    def store(self, board, depth, move, g, alpha, beta):
+    def store(self, state_key, depth, move, g, alpha, beta):
         """Store a board state in the transposition table
         """
-        state_key = board.hash_state()
-
         if depth <= 0 or alpha < g < beta:
-            state = 'LEAF'
+            state = LEAF
         elif g >= beta:
-            state = 'LOWERBOUND'
+            state = LOWERBOUND
             g = beta
         elif g <= alpha:
-            state = 'UPPERBOUND'
+            state = UPPERBOUND
             g = alpha
         else:
             raise RuntimeError
 
-        self.tt[state_key] = (move, depth, g, state)
+        self.tt.put(state_key, move[0] if move else None, depth, g, state)
+
+    def search_move(self, board, move, player, opponent, maximize, depth, 
+                    alpha, beta, scout=False):
+        """Play a move, search the resulting position and undo the move. 
+        `maximize` tells whether the player is to move after `move`.
+
+        With `scout` (Principal Variation Search) the position is first 
+        searched with a null window at the bound of the parent: this only 
+        proves that the move is not better than the moves searched before it. 
+        If it is better after all, the position is searched again with the 
+        full window.
+
+        Returns:
+            (list, int): best move line and score of the position
+        """
+        board.play(move, opponent if maximize else player)
+
+        # The move is also undone when the search is aborted.
+        try:
+            if scout:
+                if maximize:  # Parent minimizes, test whether score < beta
+                    null_alpha, null_beta = beta - 1, beta
+                else:  # Parent maximizes, test whether score > alpha
+                    null_alpha, null_beta = alpha, alpha + 1
+                nextmove, score = self.search(
+                    board, player, opponent, maximize=maximize, depth=depth, 
+                    alpha=null_alpha, beta=null_beta
+                )
+                if alpha < score < beta:
+                    self.researches += 1
+                    nextmove, score = self.search(
+                        board, player, opponent, maximize=maximize, 
+                        depth=depth, alpha=alpha, beta=beta
+                    )
+            else:
+                nextmove, score = self.search(
+                    board, player, opponent, maximize=maximize, depth=depth, 
+                    alpha=alpha, beta=beta
+                )
+        finally:
+            board.undo()
+        return nextmove, score
+
+    def search_leaf(self, board, move, color, player, maximize, score, alpha,
+                    beta):
+        """Search the leaf reached by playing `move` with `color`, given its 
+        score from `frontier_scores`. Like `search` at depth 0, but the leaf is
+        looked up by `board.hash_move` without playing the move. `maximize` 
+        tells whether the player is to move in the leaf.
+        """
+        state_key = self.tt.state_key(
+            board.hash_move(move, color), player, maximize
+        )
+        hit, g, tt_best_move = self.lookup(state_key, 0, alpha, beta)
+        if hit:
+            self.tt_lookups += 1
+            return tt_best_move, g
+        self.nodes_searched += 1
+        return [], score
 
     def move_ordering(self, all_moves, best_moves):
         """Order moves by moving best moves to begning of the list.
         """
-        for m in best_moves:
-            if m in all_moves:
-                all_moves.insert(0, all_moves.pop(all_moves.index(m)))
+        moves = set(all_moves)
+        front = [m for m in reversed(best_moves) if m in moves]
+        if not front:
+            return all_moves
+        front_moves = set(front)
+        return front + [m for m in all_moves if m not in front_moves]
+
+    def get_moves(self, board, color, opponent, best_moves):
+        """Return the moves of a node in search order, given the best line 
+        stored in the transposition table.
+        """
+        if self.ordering is None:
+            return self.move_ordering(board.get_move_list(), best_moves)
+        return self.ordering.order(
+            board, board.get_move_list(), color, opponent, 
+            tt_move=best_moves[0] if best_moves else None
+        )
 
-        return all_moves
+    def register_cutoff(self, board, move, color, depth):
+        """Count a cutoff caused by `move` and update the move ordering."""
+        self.cutoffs += 1
+        if self.ordering is not None:
+            self.ordering.update(board, move, color, depth)
 
     def search(self, board, player, opponent, maximize=True, depth=3,
                alpha=-sys.maxsize, beta=sys.maxsize):
@@ -310,15 +915,30 @@ class TranspositionTablesAlphaBeta:
         Returns:
             (tuple, int): bestmove and score 
         """
-        hit, g, tt_best_move = self.lookup(board, depth, alpha, beta)
+        if self.use_distance_maps and board.distance_maps is None:
+            # Attach distance maps for this search only.
+            board.enable_distance_maps()
+            try:
+                return self.search(
+                    board, player, opponent, maximize, depth, alpha, beta
+                )
+            finally:
+                board.disable_distance_maps()
+
+        state_key = self.tt.state_key(board.hash_state(), player, maximize)
+        hit, g, tt_best_move = self.lookup(state_key, depth, alpha, beta)
 
         if hit:
             self.tt_lookups += 1
             return tt_best_move, g
         
+        if self.active_limits is not None:
+            self.active_limits.check()
         self.nodes_searched += 1
 
-        board_hyp = copy.deepcopy(board)
+        # Bounds of the window this node was called with, used to classify 
+        # the result in the transposition table.
+        alpha_node, beta_node = alpha, beta
 
         best_move = []
         if depth <= 0: # Reached a leaf node
@@ -328,24 +948,36 @@ class TranspositionTablesAlphaBeta:
         elif maximize:
             g = -sys.maxsize
             # order moves
-            ordered_move_list = self.move_ordering(
-                board.get_move_list(), tt_best_move
+            ordered_move_list = self.get_moves(
+                board, player, opponent, tt_best_move
             )
 
-            for move in ordered_move_list:
-                board_hyp = copy.deepcopy(board)
-                board_hyp.set_piece(move, player)
-
-                nextmove, score = self.search(
-                    board_hyp, 
-                    player, 
-                    opponent,
-                    maximize=False, 
-                    depth=depth-1,
-                    alpha=alpha, 
-                    beta=beta
+            scores = None
+            if depth == 1 and self.use_frontier():
+                scores = frontier_scores(
+                    self.heuristic, board, ordered_move_list, player, player,
+                    opponent, self.frontier_batch
                 )
 
+            for i, move in enumerate(ordered_move_list):
+                if scores is not None:
+                    nextmove, score = self.search_leaf(
+                        board, move, player, player, False, next(scores), 
+                        alpha, beta
+                    )
+                else:
+                    nextmove, score = self.search_move(
+                        board, 
+                        move,
+                        player, 
+                        opponent,
+                        maximize=False, 
+                        depth=depth-1,
+                        alpha=alpha, 
+                        beta=beta,
+                        scout=self.pvs and i > 0
+                    )
+
                 if score > g:
                     g = score
                     best_move = [move] + nextmove
@@ -353,7 +985,7 @@ class TranspositionTablesAlphaBeta:
                     best_move = [move] + nextmove
 
                 if g >= beta:
-                    self.cutoffs += 1
+                    self.register_cutoff(board, move, player, depth)
                     break
 
                 if g > alpha:
@@ -362,23 +994,35 @@ class TranspositionTablesAlphaBeta:
         else:  # Minimize
             g = sys.maxsize
             # order moves
-            ordered_move_list = self.move_ordering(
-                board.get_move_list(), tt_best_move
+            ordered_move_list = self.get_moves(
+                board, opponent, player, tt_best_move
             )
-            for move in ordered_move_list:
-                board_hyp = copy.deepcopy(board)
-                board_hyp.set_piece(move, opponent)
-
-                nextmove, score = self.search(
-                    board_hyp, 
-                    player, 
-                    opponent,
-                    maximize=True, 
-                    depth=depth-1,
-                    alpha=alpha, 
-                    beta=beta
+            scores = None
+            if depth == 1 and self.use_frontier():
+                scores = frontier_scores(
+                    self.heuristic, board, ordered_move_list, opponent, player,
+                    opponent, self.frontier_batch
                 )
 
+            for i, move in enumerate(ordered_move_list):
+                if scores is not None:
+                    nextmove, score = self.search_leaf(
+                        board, move, opponent, player, True, next(scores), 
+                        alpha, beta
+                    )
+                else:
+                    nextmove, score = self.search_move(
+                        board, 
+                        move,
+                        player, 
+                        opponent,
+                        maximize=True, 
+                        depth=depth-1,
+                        alpha=alpha, 
+                        beta=beta,
+                        scout=self.pvs and i > 0
+                    )
+
                 if score < g:
                     g = score
                     best_move = [move] + nextmove
@@ -386,20 +1030,56 @@ class TranspositionTablesAlphaBeta:
                     best_move = [move] + nextmove
 
                 if g <= alpha:
-                    self.cutoffs += 1
+                    self.register_cutoff(board, move, opponent, depth)
                     break
 
                 if g < beta:
                     beta = g
 
-        self.store(board_hyp, depth, best_move, g, alpha, beta)
+        self.store(state_key, depth, best_move, g, alpha_node, beta_node)
 
         return best_move, g
 
+    def search_aspiration(self, board, player, opponent, g_previous=None):
+        """Search the board at the current search depth. With an aspiration 
+        window, the search starts with a window around the score of the 
+        previous depth, `g_previous`. A bound the score falls on is opened and
+        the board is searched again, until the score lies inside the window.
+
+        Returns:
+            (tuple, int): best move and score
+        """
+        alpha, beta = -sys.maxsize, sys.maxsize
+        if self.aspiration_window is not None and g_previous is not None:
+            alpha = max(g_previous - self.aspiration_window, -sys.maxsize)
+            beta = min(g_previous + self.aspiration_window, sys.maxsize)
+
+        while True:
+            move, g = self.search(
+                board, 
+                player, 
+                opponent, 
+                depth=self.search_depth,
+                alpha=alpha,
+                beta=beta
+            )
+            if g <= alpha and alpha > -sys.maxsize:
+                alpha = -sys.maxsize
+            elif g >= beta and beta < sys.maxsize:
+                beta = sys.maxsize
+            else:
+                return move, g
+            self.aspiration_researches += 1
+
     def iterative_deepening(self, board, player, opponent):
         """Iterative deepening algorithm. 
-        
-        Note: the timout will always be exceeded by a few seconds.
+
+        A next depth is only started when its predicted duration, extrapolated
+        from the growth of the number of nodes of the previous iterations, 
+        fits in the remaining time. A depth that exceeds the limits anyway is
+        aborted, and the result of the deepest completed depth is returned. 
+        If no depth completed, the first move in search order is returned 
+        with score None.
 
         Args:
             board (obj): game.HexBoard object
@@ -411,21 +1091,97 @@ class TranspositionTablesAlphaBeta:
         """
 
         self.reset()
+        self.limits.start()
 
-        t0 = time.time()
+        maxdepth = min(self.maxdepth, board.get_move_count())
 
-        # TODO This will always exceed the timeout
-        while self.search_depth <= self.maxdepth and time.time() - t0 < self.maxtime:
+        move, g = self.get_moves(board, player, opponent, [])[:1], None
+        for _, move, g in self.deepen(
+                board, player, opponent, range(1, maxdepth+1)):
+            pass
+        
+        return move, g
+
+    def search_mtdf(self, board, player, opponent, f=None):
+        """Search the board at the current search depth with MTD(f): a 
+        sequence of zero window searches that moves a lower and an upper bound
+        on the score towards each other, starting from the guess `f`, e.g. 
+        the score of the previous depth. The passes reuse each others results 
+        through the transposition table.
+
+        Returns:
+            (tuple, int): best move and score
+        """
+        g = 0 if f is None else f
+        lower, upper = -sys.maxsize, sys.maxsize
+        best_move = []
+        while lower < upper:
+            beta = max(g, lower + 1)
             move, g = self.search(
                 board, 
                 player, 
                 opponent, 
-                depth=self.search_depth
+                depth=self.search_depth,
+                alpha=beta - 1,
+                beta=beta
             )
-            self.search_depth += 1
-        self.search_depth -= 1
-        
-        return move, g
+            self.mtdf_passes += 1
+            if g < beta:
+                upper = g
+            else:
+                lower = g
+                # A fail high proves the move reaches the lower bound, so 
+                # it is a best move once the bounds meet.
+                best_move = move
+        return best_move or move, g
+
+    def deepen(self, board, player, opponent, depths):
+        """Search the board at each of `depths` in turn and yield 
+        (depth, best move, score) after every completed depth. Stops early 
+        when the next depth is not expected to finish in time, and when the 
+        limits are exceeded, see `iterative_deepening`. The limits are only
+        checked here, during the searches of the depths. An aborted depth 
+        leaves the board as it was and is not yielded.
+        """
+        history_length = len(board.history)
+        g = None
+
+        completed = 0
+        for depth in depths:
+            self.search_depth = depth
+            t_start = time.time()
+            nodes_searched = self.nodes_searched
+            self.active_limits = self.limits
+            try:
+                if self.mtdf:
+                    move, g = self.search_mtdf(board, player, opponent, g)
+                else:
+                    move, g = self.search_aspiration(board, player, opponent, g)
+            except SearchAborted:
+                restore_board(board, history_length)
+                self.search_depth = completed
+                self.aborted = True
+                return
+            finally:
+                self.active_limits = None
+            t_iteration = time.time() - t_start
+            completed = depth
+            self.nodes_per_depth.append(self.nodes_searched - nodes_searched)
+            self.limits.iteration()
+
+            yield depth, move, g
+
+            # Predict the next depth from the growth of the number of nodes.
+            # Without a previous depth there is no estimate, and a depth that
+            # does not fit is aborted anyway.
+            t_predicted = 0
+            if len(self.nodes_per_depth) > 1 and self.nodes_per_depth[-2]:
+                t_predicted = (
+                    t_iteration * 
+                    self.nodes_per_depth[-1] / self.nodes_per_depth[-2]
+                )
+            if t_predicted > self.limits.remaining() or self.limits.exceeded():
+                break
 
     def print_summary(self):
         """print summary of search.
@@ -438,142 +1194,295 @@ class TranspositionTablesAlphaBeta:
             'Nodes searched:              | {nodes_searched}\n'
             'Alpha-Beta pruning cutoffs:  | {cutoffs}\n'
             'Transposition table lookups: | {tt_lookups}\n'
-            '-----------------------------------------------------'+'\n'
+            'Transposition table usage:   | {tt_usage:.1%}\n'
+            'Last depth aborted:          | {aborted}\n'
+            'Nodes per depth:             | {nodes_per_depth}\n'
         )
+        if self.mtdf:
+            summary_txt += 'MTD(f) passes:               | {mtdf_passes}\n'
+        if self.pvs or self.aspiration_window is not None:
+            summary_txt += (
+                'PVS/aspiration re-searches:  | {researches}/'
+                '{aspiration_researches}\n'
+            )
+        if isinstance(self.heuristic, EvaluationCache):
+            summary_txt += 'Evaluation cache hits/misses:| {hits}/{misses}\n'
+        summary_txt += '-----------------------------------------------------\n'
         
         print(
             summary_txt.format(
                 depth=self.search_depth,
                 nodes_searched=self.nodes_searched,
                 cutoffs=self.cutoffs,
-                tt_lookups=self.tt_lookups
+                tt_lookups=self.tt_lookups,
+                tt_usage=self.tt.usage(),
+                aborted=self.aborted,
+                mtdf_passes=self.mtdf_passes,
+                nodes_per_depth=self.nodes_per_depth,
+                researches=self.researches,
+                aspiration_researches=self.aspiration_researches,
+                hits=getattr(self.heuristic, 'hits', 0),
+                misses=getattr(self.heuristic, 'misses', 0),
             )
         )
 
 class MonteCarloTreeSearch:
     """Monte Carlo Tree Search algorithm for Hex.
     """
-    def __init__(self, maxiter=1000, maxtime=5, cp=1):
+    def __init__(self, maxiter=1000, maxtime=5, cp=1, limits=None, 
+                 rollout='fill', batch_size=1, reuse_tree=True):
         """
         Args:
             maxiter (int, optional): Maximum number of iterations. Defaults to 
                 1000.
             maxtime (int, optional): Maximum time in seconds. Defaults to 5.
             cp (int, optional): Cp parameter for MCTS algorithm. Defaults to 1.
+            limits (obj, optional): utils.SearchLimits checked between 
+                iterations. Defaults to None, which limits the search to 
+                `maxiter` and `maxtime`.
+            rollout (str, optional): Rollout mode, 'fill' (see `rollout_fill`)
+                or 'play' (see `rollout_play`). Defaults to 'fill'.
+            batch_size (int, optional): Number of rollouts per iteration. 
+                More than one are run at once on a batch.HexBoardBatch, see 
+                `rollout_batch`, which only supports the 'fill' mode. 
+                Defaults to 1.
+            reuse_tree (bool, optional): Keep the tree between searches and
+                continue from the subtree of the new position, see 
+                `find_subtree`. Defaults to True.
+
+        Raises:
+            ValueError: Unknown rollout mode, or 'play' rollouts with a 
+                `batch_size` larger than 1
         """
+        if rollout not in ('fill', 'play'):
+            raise ValueError('Unknown rollout mode "{}"'.format(rollout))
+        if rollout == 'play' and batch_size > 1:
+            raise ValueError(
+                'Rollout mode "play" does not support a batch_size of {}'
+                .format(batch_size)
+            )
         self.maxiter = maxiter
         self.maxtime = maxtime
         self.cp = cp
-
-    def best_child(self, node):
-        """Calculate the best child for a given node.
+        self.rollout_mode = rollout
+        self.batch_size = batch_size
+        if limits is None:
+            limits = SearchLimits(maxtime=maxtime, maxiter=maxiter)
+        self.limits = limits
+        self.reuse_tree = reuse_tree
+        self.tree = None
+        self.iterations = 0
+        self.playouts = 0
+        self.reused_visits = 0
+
+    def best_child(self, node, color):
+        """Calculate the best child for a given node with `color` to move, 
+        with the UCT weights of all its children computed at once. Scores are
+        stored from the view of the searching player, so at nodes of the 
+        opponent the children are weighted on the opponent's wins.
         """
-        weights = [
-            c.score/c.visited + self.cp * np.sqrt(np.log(node.visited/c.visited))
-            for c in node.children
-        ]
-        # Select best child randomly out equally good children
-        return node.children[np.argmax(weights == np.amax(weights))]
+        tree = self.tree
+        children = tree.children(node)
+        visits = tree.visits[children]
+        wins = tree.scores[children]
+        if color != self.player_to_move:
+            wins = visits - wins
+        weights = (
+            wins/visits + self.cp * np.sqrt(np.log(tree.visits[node]/visits))
+        )
+        return children.start + np.argmax(weights)
 
     def get_most_visited_child(self, node):
         """Lookup the most visited child of a node.
         """
-        visits = [c.visited for c in node.children]
-        # Select best child randomly out equally good children
-        return node.children[np.argmax(visits == np.amax(visits))]
-
-    def make_node_move(self, node, board):
-        """Make the move of a node on the board.
-        """
-        if node.player_to_move == self.player_to_move:
-            board.set_piece(node.move, self.opponent)
-        else:
-            board.set_piece(node.move, self.player_to_move)
+        children = self.tree.children(node)
+        return children.start + np.argmax(self.tree.visits[children])
 
-    def select(self):
-        """Select the next node to explore.
+    def make_node_move(self, node, board, color):
+        """Make the move of a node on the board for `color`.
         """
-        node = self.root
-        board_hyp = copy.deepcopy(self.root_board)
+        board.play(divmod(int(self.tree.move[node]), board.size), color)
 
-        # Traverse down the tree until unexplored node (leaf) is found.
-        while node.is_fully_expanded():
-            node = self.best_child(node)
-            self.make_node_move(node, board_hyp)
+    def other_player(self, color):
+        if color == self.player_to_move:
+            return self.opponent
+        return self.player_to_move
 
-            if node.visited == 0:
-                return node, board_hyp
-        
-        # If the node has no children, expand the node.
-        if not node.children:
-            self.expand(node, board_hyp)
-        
-        # Randomly pick a child
-        if node.children:
-            node = np.random.choice(node.children)
-            self.make_node_move(node, board_hyp)
+    def select(self):
+        """Select the next node to explore. The moves leading to the node are
+        played on the root board, see `restore_root_board`.
 
-        return node, board_hyp
+        Returns:
+            (int, obj, int): node, board and the player to move in the node
+        """
+        tree = self.tree
+        node = 0
+        color = self.player_to_move
+        board_hyp = self.root_board
+
+        # Traverse down the tree until an unexplored node (leaf) is found.
+        while True:
+            if not tree.is_expanded(node):
+                self.expand(node, board_hyp)
+            if tree.n_children[node] == 0:  # Full board
+                return node, board_hyp, color
+
+            child = tree.try_child(node)
+            if child is None:  # All children visited
+                child = self.best_child(node, color)
+            self.make_node_move(child, board_hyp, color)
+            node = child
+            color = self.other_player(color)
+
+            if tree.visits[node] == 0:
+                return node, board_hyp, color
 
     def expand(self, node, board):
-        """Expand a node.
+        """Expand a node. The children are shuffled, so trying them in order 
+        (see `utils.SearchTree.try_child`) visits them in random order.
         """
-        if node.player_to_move == self.player_to_move:
-            next_player = self.opponent
-        else:
-            next_player = self.player_to_move
-
-        for move in board.get_move_list():
-            child_node = Node(next_player, move, node)
-            node.add_child(child_node)
+        size = board.size
+        moves = [y*size + x for y, x in board.get_move_list()]
+        random.shuffle(moves)
+        self.tree.expand(node, moves)
 
     def select_random_move(self, board):
         """Select Random move.
         """
-        movelist = board.get_move_list()
-        idx_move = np.random.randint(len(movelist))
-        return movelist[idx_move]
+        return board.random_move()
 
     def rollout_policy(self, board):
         return self.select_random_move(board)
 
-    def rollout(self, leaf, board):
-        """Rollout/playout a given board state using the rollout_policy.
+    def rollout(self, color, board):
+        """Rollout/playout a given board state with `color` to move, the board
+        is left unchanged.
+
+        Returns:
+            float: 1 if the player wins, 0 if the opponent wins, 0.5 on a draw.
+                The mean result for batch rollouts.
+        """
+        if self.batch_size > 1:
+            return self.rollout_batch(color, board)
+        if self.rollout_mode == 'fill':
+            return self.rollout_fill(color, board)
+        return self.rollout_play(color, board)
+
+    def rollout_fill(self, color, board):
+        """Rollout by filling the board with random moves at once. 
+
+        A full Hex board has exactly one winner, and pieces placed after a 
+        win can not change it. So filling all empty cells in a random order 
+        and checking the winner once gives the same result as playing those
+        moves until the game is over. The cells are shuffled once, the player 
+        to move gets the even positions, and the winner is found with a 
+        single flood fill on the bitboard (`geometry.HexGeometry.connected`).
+        The board itself is not changed.
+        """
+        empty = board.get_move_list()
+        random.shuffle(empty)
+        if color == self.player_to_move:
+            cells = empty[0::2]
+        else:
+            cells = empty[1::2]
+
+        size = board.size
+        bits = board.bits[self.player_to_move]
+        for y, x in cells:
+            bits |= 1 << (y*size + x)
+
+        if board.geometry.connected(bits, self.player_to_move):
+            return 1
+        return 0
+
+    def rollout_batch(self, color, board):
+        """Run `batch_size` fill rollouts (see `rollout_fill`) at once: the 
+        position is copied into a batch.HexBoardBatch, every copy is filled 
+        in its own random order, and the winners are found with 
+        connected-component labeling. Returns the fraction of wins, which is
+        backpropagated with a weight of `batch_size`.
         """
-        board_hyp = copy.deepcopy(board)
+        batch = HexBoardBatch.from_board(board, self.batch_size)
+        batch.fill_random(color)
+        return batch.check_win(self.player_to_move).mean()
 
-        current_player = leaf.player_to_move
-        while not board_hyp.is_game_over():
-            move = self.rollout_policy(board_hyp)
-            board_hyp.set_piece(move, current_player)
+    def rollout_play(self, color, board):
+        """Rollout/playout a given board state using the rollout_policy. The 
+        board is restored afterwards.
+        """
+        n_moves = 0
+        current_player = color
+        while not board.is_game_over():
+            move = self.rollout_policy(board)
+            board.play(move, current_player)
+            n_moves += 1
             
             if current_player == self.player_to_move:
                 current_player = self.opponent
             else:
                 current_player = self.player_to_move
 
-        if board_hyp.check_win(self.player_to_move):
-            return 1
-        elif board_hyp.check_win(self.opponent):
-            return 0
+        if board.check_win(self.player_to_move):
+            result = 1
+        elif board.check_win(self.opponent):
+            result = 0
         else: # draw
-            return 0.5
+            result = 0.5
+
+        for _ in range(n_moves):
+            board.undo()
+        return result
 
-    def update_node(self, node, result):
-        """Update node value.
+    def restore_root_board(self):
+        """Undo all moves played on the root board during an iteration.
         """
-        node.visited += 1
-        node.score += result
-        return node
+        while len(self.root_board.history) > self.root_history_length:
+            self.root_board.undo()
 
-    def backpropagate(self, node, result):
-        """Recursively move up the tree while updating node values.
+    def backpropagate(self, node, result, weight=1):
+        """Update the values of a node and its ancestors with the mean 
+        `result` of `weight` rollouts.
         """
-        node = self.update_node(node, result)
-        if node.parent == None: # parent node
-            return
-        else: # Move one node up
-            self.backpropagate(node.parent, result)
+        self.tree.backpropagate(node, result, weight)
+
+    def find_subtree(self, board, player_to_move, opponent):
+        """Find the node of the previous search tree for the position on 
+        `board`. That position must follow from the previous root by moves in
+        the board history, played in turns and starting with the same player,
+        like our move and the reply of the opponent.
+
+        Returns:
+            int: node in `self.tree`, None if the position is not in the tree
+        """
+        if (self.tree is None or board.size != self.root_board.size or 
+                (player_to_move, opponent) != 
+                (self.player_to_move, self.opponent)):
+            return None
+        n_moves = len(board.history) - self.root_history_length
+        if n_moves <= 0 or n_moves % 2:
+            return None
+        moves = [(i, color) for i, color, *_ in board.history[-n_moves:]]
+
+        # The board minus these moves must be the previous root position.
+        key = board.key
+        for i, color in moves:
+            key ^= board.geometry.zobrist[color][i]
+        if key != self.root_board.key:
+            return None
+
+        tree = self.tree
+        node = 0
+        expected = self.player_to_move
+        for i, color in moves:
+            if color != expected or not tree.is_expanded(node):
+                return None
+            children = tree.children(node)
+            match = np.flatnonzero(tree.move[children] == i)
+            if not len(match):
+                return None
+            node = children.start + match[0]
+            expected = self.other_player(expected)
+        return node
 
     def search(self, board, player_to_move, opponent):
         """Find the best move for a player given a board state.
@@ -586,40 +1495,41 @@ class MonteCarloTreeSearch:
         Returns:
             tuple: best move
         """
+        node = None
+        if self.reuse_tree:
+            node = self.find_subtree(board, player_to_move, opponent)
+        if node is None:
+            self.tree = SearchTree()
+        else:
+            self.tree = self.tree.subtree(node)
+        self.reused_visits = self.tree.visits[0]
+
         self.player_to_move = player_to_move
         self.opponent = opponent
-
-        self.root = Node(self.player_to_move)
-        self.root_board = copy.deepcopy(board)
-
-        t0 = time.time()
-        i = 0
-        while time.time()-t0 < self.maxtime and i < self.maxiter:
-            leaf, board = self.select()
-            simulation_result = self.rollout(leaf, board)
-            self.backpropagate(leaf, simulation_result)
-            i+=1
-
-        best_child = self.get_most_visited_child(self.root)
-        best_move = best_child.move
+        self.root_board = board.copy()
+        self.root_history_length = len(self.root_board.history)
+
+        self.limits.start()
+        while not self.limits.exceeded():
+            leaf, board, color = self.select()
+            simulation_result = self.rollout(color, board)
+            self.backpropagate(leaf, simulation_result, self.batch_size)
+            self.restore_root_board()
+            self.limits.iteration()
+        self.iterations = self.limits.iterations
+        self.playouts = self.iterations*self.batch_size
+
+        if not self.tree.n_tried[0]:  # No iteration within the limits
+            return board.get_move_list()[0]
+        best_child = self.get_most_visited_child(0)
+        best_move = divmod(int(self.tree.move[best_child]), board.size)
 
         return best_move
 
     def get_tree_size(self):
-        """Calculate the tree size.
+        """Return the number of nodes in the tree.
         """
-        size = 0
-
-        queue = [self.root]
-        while queue:
-            node = queue.pop()
-            
-            for child in node.children:
-                queue.append(child)
-            
-            size += 1
-
-        return size
+        return self.tree.size
 
     def print_summary(self):
         """print summary of search.
@@ -629,11 +1539,17 @@ class MonteCarloTreeSearch:
             'SUMMARY OF MOVE TAKING PROCESS:\n'
             '-----------------------------------------------------'+'\n'
             'Search tree size             | {treesize}\n'
+            'Iterations                   | {iterations}\n'
+            'Playouts                     | {playouts}\n'
+            'Reused visits                | {reused_visits:.0f}\n'
             '-----------------------------------------------------'
         )
         
         print(
             summary_txt.format(
                 treesize=self.get_tree_size(),
+                iterations=self.iterations,
+                playouts=self.playouts,
+                reused_visits=self.reused_visits,
             )
         )
\ No newline at end of file
@@ -0,0 +1,130 @@
+import numpy as np
+from scipy import ndimage
+
+from src.geometry import BLUE, RED, EMPTY
+
+# Connectivity of a cell in (row, column) coordinates: the six hex neighbors.
+# The batch axis is not connected, so positions are labeled independently.
+HEX_STRUCTURE = np.array([
+    [[0, 0, 0], [0, 0, 0], [0, 0, 0]],
+    [[0, 1, 1], [1, 1, 1], [1, 1, 0]],
+    [[0, 0, 0], [0, 0, 0], [0, 0, 0]],
+], dtype=bool)
+
+class HexBoardBatch:
+    """Batch of Hex positions of the same size, stored in one
+    (N, size, size) int8 array, with vectorized move application and win
+    detection. Used for bulk simulation, single games use game.HexBoard.
+    """
+    BLUE = BLUE
+    RED = RED
+    EMPTY = EMPTY
+
+    def __init__(self, size, n_boards):
+        """
+        Args:
+            size (int): Size of the boards
+            n_boards (int): Number of boards in the batch
+        """
+        self.size = size
+        self.n_boards = n_boards
+        self.cells = np.full((n_boards, size, size), EMPTY, dtype=np.int8)
+
+    @classmethod
+    def from_board(cls, board, n_boards):
+        """Create a batch of `n_boards` copies of a game.HexBoard position.
+        """
+        batch = cls(board.size, n_boards)
+        batch.cells[:] = np.frombuffer(board.cells, dtype=np.int8).reshape(
+            board.size, board.size
+        )
+        return batch
+
+    @classmethod
+    def from_boards(cls, boards):
+        """Create a batch from a list of game.HexBoard objects of the same
+        size.
+        """
+        batch = cls(boards[0].size, len(boards))
+        for i, board in enumerate(boards):
+            batch.cells[i] = np.frombuffer(board.cells, dtype=np.int8).reshape(
+                board.size, board.size
+            )
+        return batch
+
+    def __len__(self):
+        return self.n_boards
+
+    def get_empty(self):
+        """Return (N, size, size) boolean mask of empty cells."""
+        return self.cells == EMPTY
+
+    def set_pieces(self, moves, color):
+        """Place one piece on every board.
+
+        Args:
+            moves (array): (N, 2) array of (row, column) positions, one per
+                board.
+            color (int or array): Color of the pieces, either one value or one
+                per board.
+
+        Raises:
+            RuntimeWarning: A position is already occupied.
+        """
+        moves = np.asarray(moves)
+        index = np.arange(self.n_boards)
+        rows, cols = moves[:, 0], moves[:, 1]
+        if np.any(self.cells[index, rows, cols] != EMPTY):
+            raise RuntimeWarning('cannot set piece: invalid move.')
+        self.cells[index, rows, cols] = color
+
+    def fill_random(self, color):
+        """Fill the empty cells of every board with alternating pieces in an
+        independent random order, starting with `color`. The pieces of a 
+        board are placed in the order of random keys, so a board gets the 
+        same pieces as a random game played to the end.
+
+        Args:
+            color (int): Color of the first piece
+        """
+        other = RED if color == BLUE else BLUE
+        cells = self.cells.reshape(self.n_boards, -1)
+        empty = cells == EMPTY
+
+        keys = np.random.random(cells.shape)
+        keys[~empty] = 2  # Occupied cells are ranked after the empty cells
+        rank = np.argsort(np.argsort(keys, axis=1), axis=1)
+        fill = np.where(rank % 2 == 0, color, other).astype(np.int8)
+        cells[empty] = fill[empty]
+
+    def check_win(self, color):
+        """Check for every board whether `color` connects its edges, using
+        connected-component labeling.
+
+        Returns:
+            array: (N,) boolean array
+        """
+        labels, n_labels = ndimage.label(
+            self.cells == color, structure=HEX_STRUCTURE
+        )
+        if color == BLUE:  # horizontal
+            start, end = labels[:, :, 0], labels[:, :, -1]
+        elif color == RED:  # vertical
+            start, end = labels[:, 0, :], labels[:, -1, :]
+        else:
+            raise ValueError('Unkown player value {}'.format(color))
+
+        # Labels are unique over the whole batch, so a label touching both
+        # edges identifies a winning board.
+        on_start = np.zeros(n_labels+1, dtype=bool)
+        on_start[start] = True
+        on_start[0] = False
+        return on_start[end].any(axis=1)
+
+    def winners(self):
+        """Return the winning color of every board, 0 if there is no winner.
+        """
+        winners = np.zeros(self.n_boards, dtype=np.int8)
+        winners[self.check_win(RED)] = RED
+        winners[self.check_win(BLUE)] = BLUE
+        return winners
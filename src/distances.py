@@ -0,0 +1,264 @@
+import heapq
+import sys
+from collections import deque
+
+from src.geometry import BLUE, RED
+
+INF = sys.maxsize
+
+class DistanceMaps:
+    """Shortest path distances from both edges of both colors to every cell of
+    a board, kept up to date while pieces are played and undone.
+
+    The distance of a node is the cost of the cheapest path from the edge to
+    that node, including the node itself. Entering an empty cell costs 1, an
+    own stone or virtual edge node 0, and cells of the opponent can not be
+    entered. The shortest path of a color is the distance of its sink node in
+    the map measured from its source node.
+
+    A placed piece changes the cost of a single cell. Where that lowers the
+    cost, lower distances are propagated from the cell. Where it raises the
+    cost, the nodes whose shortest paths all run through the cell are
+    collected and only those are recomputed from their unaffected neighbors.
+    When that region grows too large the map is recomputed from scratch. All
+    changes are logged, so undo restores the maps without any search.
+    """
+    # Fraction of the nodes above which a full recompute is cheaper than
+    # repairing the affected region.
+    max_affected = 0.5
+
+    def __init__(self, board):
+        """
+        Args:
+            board (obj): game.HexBoard object the maps are attached to
+        """
+        self.board = board
+        self.geometry = board.geometry
+        self.limit = int(self.max_affected*self.geometry.n_nodes)
+
+        # Cost of entering a cell per color, indexed by cell value.
+        self.costs = {
+            BLUE: (INF, 0, INF, 1),
+            RED: (INF, INF, 0, 1),
+        }
+
+        # (color, root node) -> distance per node. The lists are only changed
+        # in place, so log entries can refer to them.
+        self.dist = {}
+        for color in (BLUE, RED):
+            for root in self.geometry.edge_nodes[color]:
+                self.dist[(color, root)] = self.compute(color, root)
+
+        # List of changes (distance list, node, old value) for every piece in
+        # the board history. None for pieces played before the maps were
+        # attached, these require a recompute on undo.
+        self.log = [None]*len(board.history)
+
+        self.n_updates = 0
+        self.n_recomputes = 0
+
+    def copy(self, board):
+        """Return a copy of the maps attached to `board`. The copy can not
+        undo moves played before it was made without a recompute.
+        """
+        maps = DistanceMaps.__new__(DistanceMaps)
+        maps.board = board
+        maps.geometry = self.geometry
+        maps.limit = self.limit
+        maps.costs = self.costs
+        maps.dist = {key: dist[:] for key, dist in self.dist.items()}
+        maps.log = [None]*len(board.history)
+        maps.n_updates = self.n_updates
+        maps.n_recomputes = self.n_recomputes
+        return maps
+
+    def cost(self, color, node):
+        """Cost of entering a node for `color`."""
+        if node >= self.geometry.n_cells:
+            return 0
+        return self.costs[color][self.board.cells[node]]
+
+    def compute(self, color, root):
+        """Compute the distances from `root` with a 0-1 BFS.
+        """
+        adjacency = self.geometry.adjacency[color]
+        # Entry costs as in `cost`, inlined in the loops.
+        cell_costs = self.costs[color]
+        cells = self.board.cells
+        n_cells = self.geometry.n_cells
+        dist = [INF]*self.geometry.n_nodes
+        dist[root] = 0
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            d = dist[node]
+            for n in adjacency[node]:
+                cost = cell_costs[cells[n]] if n < n_cells else 0
+                if cost == INF or d + cost >= dist[n]:
+                    continue
+                dist[n] = d + cost
+                if cost:
+                    queue.append(n)
+                else:
+                    queue.appendleft(n)
+        return dist
+
+    def shortest_path(self, color):
+        """Return the length of the shortest path of `color`, None if there is
+        no path.
+        """
+        source, sink = self.geometry.edge_nodes[color]
+        d = self.dist[(color, source)][sink]
+        return None if d == INF else d
+
+    def path_distance(self, color, node):
+        """Return the length of the shortest path of `color` through `node`,
+        INF if there is no such path.
+        """
+        source, sink = self.geometry.edge_nodes[color]
+        d_source = self.dist[(color, source)][node]
+        d_sink = self.dist[(color, sink)][node]
+        if d_source == INF or d_sink == INF:
+            return INF
+        return d_source + d_sink - self.cost(color, node)
+
+    def reset(self):
+        """Recompute all maps and forget the log, used when the board history
+        is cleared.
+        """
+        for (color, root), dist in self.dist.items():
+            dist[:] = self.compute(color, root)
+        self.log = []
+        self.n_recomputes += 1
+
+    def update(self, cell, color):
+        """Update the maps after a piece of `color` was placed on `cell`.
+        """
+        changes = []
+        for (map_color, root), dist in self.dist.items():
+            if map_color == color:
+                self._decrease(map_color, root, dist, cell, changes)
+            else:
+                self._increase(map_color, root, dist, cell, changes)
+        self.log.append(changes)
+        self.n_updates += 1
+
+    def undo(self):
+        """Restore the maps after the last piece was taken back. Must be called
+        after the piece is removed from the board.
+        """
+        changes = self.log.pop()
+        if changes is None:
+            for (color, root), dist in self.dist.items():
+                dist[:] = self.compute(color, root)
+            self.n_recomputes += 1
+            return
+        for dist, node, old in reversed(changes):
+            dist[node] = old
+
+    def _decrease(self, color, root, dist, cell, changes):
+        """Propagate lower distances from a cell whose cost decreased.
+        """
+        adjacency = self.geometry.adjacency[color]
+        # Entry costs as in `cost`, inlined in the loops.
+        cell_costs = self.costs[color]
+        cells = self.board.cells
+        n_cells = self.geometry.n_cells
+        d = min(dist[n] for n in adjacency[cell])
+        if d == INF:
+            return
+        d += cell_costs[cells[cell]] if cell < n_cells else 0
+        if d >= dist[cell]:
+            return
+
+        changes.append((dist, cell, dist[cell]))
+        dist[cell] = d
+        heap = [(d, cell)]
+        while heap:
+            d, node = heapq.heappop(heap)
+            if d > dist[node]:
+                continue
+            for n in adjacency[node]:
+                cost = cell_costs[cells[n]] if n < n_cells else 0
+                if cost == INF or d + cost >= dist[n]:
+                    continue
+                changes.append((dist, n, dist[n]))
+                dist[n] = d + cost
+                heapq.heappush(heap, (d + cost, n))
+
+    def _increase(self, color, root, dist, cell, changes):
+        """Repair the distances after the cost of a cell increased.
+        """
+        if dist[cell] == INF:
+            return
+        adjacency = self.geometry.adjacency[color]
+        # Entry costs as in `cost`, inlined in the loops.
+        cell_costs = self.costs[color]
+        cells = self.board.cells
+        n_cells = self.geometry.n_cells
+
+        # Collect the nodes whose shortest paths all run through `cell`, in
+        # order of (old) distance. A node keeps its distance when it has a
+        # tight neighbor outside the affected region with a strictly smaller
+        # distance, or the root. Ties through free nodes are treated as
+        # affected, which is safe but may enlarge the region.
+        affected = {cell}
+        heap = []
+
+        def push_successors(node):
+            d = dist[node]
+            for n in adjacency[node]:
+                if n == root or n in affected or dist[n] == INF:
+                    continue
+                cost = cell_costs[cells[n]] if n < n_cells else 0
+                if dist[n] == d + cost:
+                    heapq.heappush(heap, (dist[n], n))
+
+        push_successors(cell)
+        while heap:
+            d, node = heapq.heappop(heap)
+            if node in affected:
+                continue
+            cost = cell_costs[cells[node]] if node < n_cells else 0
+            supported = False
+            for n in adjacency[node]:
+                if n in affected:
+                    continue
+                if dist[n] + cost == d and (n == root or dist[n] < d):
+                    supported = True
+                    break
+            if supported:
+                continue
+            affected.add(node)
+            if len(affected) > self.limit:
+                changes.append((dist, slice(None), dist[:]))
+                dist[:] = self.compute(color, root)
+                self.n_recomputes += 1
+                return
+            push_successors(node)
+
+        # Recompute the affected region from its boundary.
+        for node in affected:
+            changes.append((dist, node, dist[node]))
+            dist[node] = INF
+        heap = []
+        for node in affected:
+            cost = cell_costs[cells[node]] if node < n_cells else 0
+            if cost == INF:
+                continue
+            d = min(dist[n] for n in adjacency[node])
+            if d < INF:
+                dist[node] = d + cost
+                heapq.heappush(heap, (d + cost, node))
+        while heap:
+            d, node = heapq.heappop(heap)
+            if d > dist[node]:
+                continue
+            for n in adjacency[node]:
+                if n not in affected:
+                    continue
+                cost = cell_costs[cells[n]] if n < n_cells else 0
+                if cost == INF or d + cost >= dist[n]:
+                    continue
+                dist[n] = d + cost
+                heapq.heappush(heap, (d + cost, n))
@@ -0,0 +1,151 @@
+import time as t
+
+import numpy as np
+
+from src.algorithms import (
+    AlphaBeta, TranspositionTablesAlphaBeta, SparseShortestPathHeuristic, 
+    shortest_path_heuristic
+)
+from src.game import HexBoard
+from src.robot import HexRobot
+
+# Throughput targets per board size on a single core. Alpha-Beta is measured
+# as nodes searched per second by iterative deepening, MCTS as playouts per
+# second. See README.md.
+TARGETS = {
+    5:  {'nodes/s': 30000, 'playouts/s': 12500},
+    7:  {'nodes/s': 20000, 'playouts/s': 15000},
+    9:  {'nodes/s': 10000, 'playouts/s': 12500},
+    11: {'nodes/s': 6000,  'playouts/s': 10000},
+    13: {'nodes/s': 4000,  'playouts/s': 7000},
+    19: {'nodes/s': 2000,  'playouts/s': 5000},
+}
+
+def opening_position(board_size, n_moves, seed=42):
+    """Create a board with `n_moves` random pieces, alternating colors."""
+    np.random.seed(seed)
+    board = HexBoard(board_size)
+    color = board.BLUE
+    for _ in range(n_moves):
+        moves = board.get_move_list()
+        board.set_piece(moves[np.random.randint(len(moves))], color)
+        color = board.RED if color == board.BLUE else board.BLUE
+    return board
+
+def benchmark_move(algorithm, board_size, maxtime=5, n_moves=4):
+    """Time a single move of a robot on an opening position.
+
+    Returns:
+        (float, float): time of the move in seconds and throughput (nodes or
+            playouts per second)
+    """
+    board = opening_position(board_size, n_moves)
+    robot = HexRobot(
+        algorithm, board.BLUE, board.RED, maxtime=maxtime, maxdepth=9,
+        maxiter=1e9
+    )
+
+    t1 = t.time()
+    robot.make_move(board)
+    t_move = t.time() - t1
+
+    if algorithm == 'mcts':
+        work = robot.engine.playouts
+    else:
+        work = robot.engine.nodes_searched
+    return t_move, work/t_move
+
+def benchmark(board_sizes=(5, 7, 9, 11, 13, 19), maxtime=5):
+    """Print move time and throughput of both time limited engines per board
+    size, next to the targets.
+    """
+    row = '{:>5} | {:<30} | {:>8.2f}s | {:>10.0f}/s | {:>8}/s'
+    print('{:>5} | {:<30} | {:>9} | {:>12} | {:>10}'.format(
+        'size', 'algorithm', 'move', 'throughput', 'target'
+    ))
+    for board_size in board_sizes:
+        for algorithm, unit in (
+            ('alpha-beta-iterative-deepening', 'nodes/s'),
+            ('mcts', 'playouts/s')
+        ):
+            t_move, throughput = benchmark_move(
+                algorithm, board_size, maxtime
+            )
+            target = TARGETS.get(board_size, {}).get(unit, '-')
+            print(row.format(
+                board_size, algorithm, t_move, throughput, target
+            ))
+
+def benchmark_drivers(board_size=7, depth=4, n_moves=4):
+    """Print the nodes searched per depth of iterative deepening with a full
+    window search, Principal Variation Search and MTD(f) on an opening 
+    position, without time limit.
+    """
+    drivers = (
+        ('alpha-beta', {}),
+        ('pvs', {'pvs': True}),
+        ('mtdf', {'mtdf': True}),
+    )
+    board = opening_position(board_size, n_moves)
+    print('{:>10} | {:>8} | {}'.format('driver', 'time', 'nodes per depth'))
+    for name, options in drivers:
+        engine = TranspositionTablesAlphaBeta(
+            maxtime=float('inf'), maxdepth=depth, **options
+        )
+        t1 = t.time()
+        engine.iterative_deepening(board, board.BLUE, board.RED)
+        print('{:>10} | {:>7.2f}s | {}'.format(
+            name, t.time() - t1, engine.nodes_per_depth
+        ))
+
+def benchmark_heuristics(board_size=11, n_moves=50, repeat=200):
+    """Print the time per evaluated position of the shortest path heuristic 
+    and of SparseShortestPathHeuristic, for single positions and for all 
+    children of a position at once.
+    """
+    board = opening_position(board_size, n_moves)
+    moves = board.get_move_list()
+    sparse_heuristic = SparseShortestPathHeuristic()
+    evaluations = (
+        ('shortest_path_heuristic', 1, 
+         lambda: shortest_path_heuristic(board, board.BLUE, board.RED)),
+        ('sparse', 1, 
+         lambda: sparse_heuristic(board, board.BLUE, board.RED)),
+        ('sparse children', len(moves), 
+         lambda: sparse_heuristic.evaluate_children(
+             board, moves, board.BLUE, board.BLUE, board.RED
+         )),
+    )
+    print('{:>25} | {:>9} | {:>12}'.format(
+        'heuristic', 'positions', 'per position'
+    ))
+    for name, n_positions, evaluate in evaluations:
+        t1 = t.perf_counter()
+        for _ in range(repeat):
+            evaluate()
+        t_position = (t.perf_counter() - t1)/repeat/n_positions
+        print('{:>25} | {:>9} | {:>10.0f}us'.format(
+            name, n_positions, t_position*1e6
+        ))
+
+def benchmark_frontier(board_size=11, n_moves=50, depth=3, 
+                       batch_sizes=(8, 32, 128)):
+    """Print the time of a fixed depth Alpha-Beta search with the shortest 
+    path heuristic and with SparseShortestPathHeuristic evaluating the 
+    frontier in batches.
+    """
+    board = opening_position(board_size, n_moves)
+    heuristic = SparseShortestPathHeuristic()
+    engines = [('shortest_path_heuristic', AlphaBeta())]
+    engines += [
+        ('frontier batch {}'.format(batch_size), 
+         AlphaBeta(heuristic=heuristic, frontier_batch=batch_size))
+        for batch_size in batch_sizes
+    ]
+    print('{:>25} | {:>8} | {:>6}'.format('engine', 'time', 'nodes'))
+    for name, engine in engines:
+        t1 = t.perf_counter()
+        engine.search(board, board.BLUE, board.RED, depth=depth)
+        print('{:>25} | {:>7.2f}s | {:>6}'.format(
+            name, t.perf_counter() - t1, engine.nodes_searched
+        ))
@@ -1,4 +1,5 @@
-import sys
+from array import array
+import random
 import os
 import warnings
 
@@ -6,14 +7,105 @@ import numpy as np
 
 from src.robot import HexRobot
 from src.user import HumanClient
-from src.algorithms import dijkstra
+from src.geometry import HexGeometry, BLUE, RED, EMPTY
+from src.distances import DistanceMaps
+
+# Type code of the arrays of node indices and set sizes: signed 16 bits, 
+# enough for boards up to 181x181.
+INDEX_TYPE = 'h'
+
+class BoardRenderer:
+    """Prints boards to the console. Renderers are shared between all boards
+    that use the same characters, see `BoardRenderer.get`.
+    """
+    _cache = {}
+
+    def __init__(self, char_empty='o', char_player1='+', char_player2='x'):
+        """
+        Args:
+            char_empty (str, optional): Character to print on empty board 
+                position. Defaults to 'o'.
+            char_player1 (str, optional): Character to print for player 1. 
+                Defaults to '+'.
+            char_player2 (str, optional): Character to print for player 2. 
+                Defaults to 'x'.
+        """
+        self.char_empty = char_empty
+        self.char_player1 = char_player1
+        self.char_player2 = char_player2
+
+    @classmethod
+    def get(cls, char_empty='o', char_player1='+', char_player2='x'):
+        """Return the (cached) renderer for a set of characters.
+        """
+        chars = (char_empty, char_player1, char_player2)
+        renderer = cls._cache.get(chars)
+        if renderer is None:
+            renderer = cls._cache[chars] = cls(*chars)
+        return renderer
+
+    def render(self, board):
+        """Return the board as string"""
+        size = board.size
+        # Width of the row and column labels, boards larger than 9x9 have two
+        # digit labels.
+        width = len(str(size))
+
+        board_string = '+'.rjust(width) + ' '*(width+1)
+        for x in range(size):
+            board_string += str(x+1).ljust(width) + ' '
+        board_string += '\n'
+        board_string += (1+(2+width)*size)*'-'
+        board_string += '\n'
+
+        for y in range(size):
+            board_string += str(y+1).rjust(width)+'|'+y*' '
+            
+            for x in range(size):
+                board_string += ' '*width
+                color = board.get_color((y, x))
+                if color == HexBoard.BLUE:
+                    board_string += self.char_player1
+                elif color == HexBoard.RED:
+                    board_string += self.char_player2
+                else: 
+                    board_string += self.char_empty
+            board_string += '\n'
+        return board_string.rstrip()
+
+    def print(self, board):
+        """Print the board to console"""
+        print(self.render(board))
+
 
 class HexBoard:
     """Base class of the board for the game Hex
+
+    The position is stored in a flat buffer with one byte per cell and in two
+    bitsets, one per color, where bit `y*size + x` represents cell (y, x). 
+    Size dependent lookup tables are shared between boards through 
+    `HexGeometry` and display settings through `BoardRenderer`. Boards use 
+    `__slots__`, so many of them can be kept in memory.
+
+    Connected groups of stones are tracked in a disjoint-set forest that also
+    contains a virtual node for every edge. A player has won when both of its
+    edge nodes are in the same set.
+
+    Every placed piece is recorded in a history, so that search algorithms 
+    can use `play` and `undo` on a single board instead of copying it.
+
+    Empty cells are kept in a list together with the position of every cell
+    in that list, so moves can be listed, sampled and removed in O(1).
     """
-    BLUE = 1
-    RED = 2
-    EMPTY = 3
+    BLUE = BLUE
+    RED = RED
+    EMPTY = EMPTY
+
+    __slots__ = (
+        'size', 'geometry', 'renderer', 'cells', 'bits', 'game_over', 'key', 
+        'empty', 'empty_index', 'parent', 'set_size', 'union_log', 'history',
+        'distance_maps'
+    )
 
     def __init__(self, size, char_empty='o', char_player1='+', 
                  char_player2='x'):
@@ -28,34 +120,104 @@ class HexBoard:
                 Defaults to 'x'.
         """
         self.size = size
-        self.char_empty = char_empty
-        self.char_player1 = char_player1
-        self.char_player2 = char_player2
+        self.geometry = HexGeometry.get(size)
+        self.renderer = BoardRenderer.get(
+            char_empty, char_player1, char_player2
+        )
 
-        self.board = np.full((size, size), HexBoard.EMPTY, dtype=int)
+        # Color value of every cell
+        self.cells = bytearray([HexBoard.EMPTY])*self.geometry.n_cells
+        # Bitsets indexed by color value, index 0 is unused.
+        self.bits = [0, 0, 0]
         self.game_over=False
+        # 64-bit Zobrist key of the position, see `hash_state`.
+        self.key = 0
+
+        # Empty positions and the index of every cell in that list (-1 when
+        # occupied). The positions are the shared tuples of the geometry.
+        self.empty = list(self.geometry.coords)
+        self.empty_index = array(INDEX_TYPE, range(self.geometry.n_cells))
+
+        # Disjoint-set forest over cells and virtual edge nodes.
+        self.parent = array(INDEX_TYPE, range(self.geometry.n_nodes))
+        self.set_size = array(INDEX_TYPE, [1])*self.geometry.n_nodes
+        # Roots that were attached to another root, in order. Used to roll
+        # back the forest on undo.
+        self.union_log = array(INDEX_TYPE)
+
+        # (cell, color, length of union_log, game_over, index in empty) for 
+        # every placed piece
+        self.history = []
+
+        # Incrementally updated distance maps, see `enable_distance_maps`.
+        self.distance_maps = None
+
+    def copy(self):
+        """Return an independent copy of the board.
+        """
+        board = HexBoard.__new__(HexBoard)
+        board.size = self.size
+        board.geometry = self.geometry
+        board.renderer = self.renderer
+        board.cells = self.cells[:]
+        board.bits = self.bits[:]
+        board.game_over = self.game_over
+        board.key = self.key
+        board.empty = self.empty[:]
+        board.empty_index = self.empty_index[:]
+        board.parent = self.parent[:]
+        board.set_size = self.set_size[:]
+        board.union_log = self.union_log[:]
+        board.history = self.history[:]
+        board.distance_maps = None
+        if self.distance_maps is not None:
+            board.distance_maps = self.distance_maps.copy(board)
+        return board
+
+    @property
+    def board(self):
+        """Position as (size, size) matrix of color values."""
+        return np.frombuffer(self.cells, dtype=np.int8).reshape(
+            self.size, self.size
+        ).astype(int)
+
+    @property
+    def char_empty(self):
+        return self.renderer.char_empty
+
+    @property
+    def char_player1(self):
+        return self.renderer.char_player1
+
+    @property
+    def char_player2(self):
+        return self.renderer.char_player2
     
     def get_size(self):
         return self.size
 
+    def get_occupied(self):
+        """Return bitset of all occupied cells."""
+        return self.bits[HexBoard.BLUE] | self.bits[HexBoard.RED]
+
     def is_game_over(self):
         """Check if the game is over.
         """
         if (self.check_win(HexBoard.RED) or self.check_win(HexBoard.BLUE) or 
-            len(self.get_move_list())==0):
+            not self.empty):
             self.game_over = True
         return self.game_over
     
     def is_empty(self, pos):
-        return self.board[pos] == HexBoard.EMPTY
+        return self.cells[pos[0]*self.size + pos[1]] == HexBoard.EMPTY
 
     def is_color(self, pos, color):
-        return self.board[pos] == color
+        return self.get_color(pos) == color
 
     def get_color(self, pos):
         if pos == (-1, -1):
             return HexBoard.EMPTY
-        return self.board[pos]
+        return self.cells[pos[0]*self.size + pos[1]]
 
     def set_piece(self, pos, color):
         """Set a piece on the board at position [r,q].
@@ -73,10 +235,94 @@ class HexBoard:
         if not self.move_is_valid(pos):
             raise RuntimeWarning('cannot set piece: invalid move.')
         else:
-            self.board[pos] = color
-            if self.check_win(HexBoard.RED) or self.check_win(HexBoard.BLUE):
+            i = pos[0]*self.size + pos[1]
+            self.history.append((
+                i, color, len(self.union_log), self.game_over, 
+                self._remove_empty(i)
+            ))
+            self.cells[i] = color
+            self.bits[color] |= 1 << i
+            self.key ^= self.geometry.zobrist[color][i]
+            self._connect(i, color)
+            if self.check_win(color):
                 self.game_over = True            
+            if self.distance_maps is not None:
+                self.distance_maps.update(i, color)
         return True
+
+    def play(self, move, color):
+        """Play a move that can be taken back with `undo`.
+
+        Args:
+            move (tup[int,int]): Position to place piece. Coordinates should 
+                be (row, column).
+            color (int): integer that indicates color.
+        """
+        self.set_piece(move, color)
+
+    def undo(self):
+        """Take back the last placed piece, restoring the board exactly to 
+        the state before it was placed.
+
+        Raises:
+            RuntimeError: No piece to take back
+        """
+        if not self.history:
+            raise RuntimeError('cannot undo: no piece has been placed.')
+        i, color, n_unions, game_over, index = self.history.pop()
+
+        parent = self.parent
+        set_size = self.set_size
+        union_log = self.union_log
+        while len(union_log) > n_unions:
+            root = union_log.pop()
+            set_size[parent[root]] -= set_size[root]
+            parent[root] = root
+
+        self.cells[i] = HexBoard.EMPTY
+        self.bits[color] &= ~(1 << i)
+        self.key ^= self.geometry.zobrist[color][i]
+        self.game_over = game_over
+
+        # Put the cell back at its original position in the empty list.
+        empty = self.empty
+        pos = self.geometry.coords[i]
+        if index == len(empty):
+            empty.append(pos)
+        else:
+            moved = empty[index]
+            self.empty_index[moved[0]*self.size + moved[1]] = len(empty)
+            empty.append(moved)
+            empty[index] = pos
+        self.empty_index[i] = index
+
+        if self.distance_maps is not None:
+            self.distance_maps.undo()
+
+    def enable_distance_maps(self):
+        """Attach distance maps that are updated on every move and return them.
+        See `distances.DistanceMaps`.
+        """
+        if self.distance_maps is None:
+            self.distance_maps = DistanceMaps(self)
+        return self.distance_maps
+
+    def disable_distance_maps(self):
+        """Detach the distance maps, moves no longer update them."""
+        self.distance_maps = None
+
+    def _remove_empty(self, i):
+        """Remove cell `i` from the list of empty cells by swapping it with the
+        last element. Returns the index the cell had in the list.
+        """
+        empty = self.empty
+        index = self.empty_index[i]
+        last = empty.pop()
+        if index < len(empty):
+            empty[index] = last
+            self.empty_index[last[0]*self.size + last[1]] = index
+        self.empty_index[i] = -1
+        return index
     
     def unset_piece(self, pos, color):
         """Remove a piece from the board.
@@ -90,8 +336,15 @@ class HexBoard:
             bool: If legal move, returns True. If position on board is empty,
                 returns False.
         """
-        if self.board[pos] == color:
-            self.board[pos] = 0
+        if self.get_color(pos) == color:
+            i = pos[0]*self.size + pos[1]
+            if self.history and self.history[-1][0] == i:
+                self.undo()
+                return True
+            self.cells[i] = HexBoard.EMPTY
+            self.bits[color] &= ~(1 << i)
+            self.key ^= self.geometry.zobrist[color][i]
+            self._rebuild_union_find()
             return True
         else:
             warnings.warn(
@@ -115,7 +368,7 @@ class HexBoard:
             return False
         y, x = pos
         if (y >= 0 and y < self.size and x >= 0 and x < self.size and 
-                self.board[pos] == HexBoard.EMPTY):
+                self.cells[y*self.size + x] == HexBoard.EMPTY):
             return True
         else:
             return False
@@ -123,78 +376,115 @@ class HexBoard:
     def get_neighbors(self, pos):
         """Get a list of neighbors of a given piostion.
         """
-        y, x = pos
-        neighbors = []
-
-        # Check if sarting position for dijsktra.
-        if y == sys.maxsize:
-            neighbors = [(self.size-1,i) for i in range(self.size)]
-        elif y == -sys.maxsize:
-            neighbors = [(0,i) for i in range(self.size)]
-        elif x == sys.maxsize:
-            neighbors = [(i,self.size-1) for i in range(self.size)]
-        elif x == -sys.maxsize:
-            neighbors = [(i,0) for i in range(self.size)]
-        # Position inside board
-        else:
-            if y-1 >= 0:
-                neighbors.append((y-1, x))
-            if y+1 < self.size:
-                neighbors.append((y+1, x))
-            if y-1 >= 0 and x+1 <= self.size-1:
-                neighbors.append((y-1, x+1))
-            if y+1 < self.size and x-1 >= 0:
-                neighbors.append((y+1, x-1))
-            if x+1 < self.size:
-                neighbors.append((y, x+1))
-            if x-1 >= 0:
-                neighbors.append((y, x-1))
-        return neighbors
+        coords = self.geometry.coords
+        return [
+            coords[i] 
+            for i in self.geometry.neighbors[pos[0]*self.size + pos[1]]
+        ]
+
+    def _find(self, i):
+        """Find the root of the set containing node `i`.
+
+        Union by size keeps the trees shallow, so no path compression is used.
+        """
+        parent = self.parent
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    def _union(self, i, j):
+        """Merge the sets containing nodes `i` and `j`.
+        """
+        root_i = self._find(i)
+        root_j = self._find(j)
+        if root_i == root_j:
+            return
+        if self.set_size[root_i] < self.set_size[root_j]:
+            root_i, root_j = root_j, root_i
+        self.parent[root_j] = root_i
+        self.set_size[root_i] += self.set_size[root_j]
+        self.union_log.append(root_j)
+
+    def _connect(self, i, color):
+        """Merge a newly placed stone with its neighbors of the same color and
+        with the edges of `color` it touches.
+        """
+        cells = self.cells
+        n_cells = self.geometry.n_cells
+        for j in self.geometry.adjacency[color][i]:
+            if j >= n_cells or cells[j] == color:
+                self._union(i, j)
+
+    def _rebuild_union_find(self):
+        """Rebuild the disjoint-set forest and the list of empty cells from 
+        scratch. This also clears the history, as it can no longer be undone.
+        """
+        self.parent = array(INDEX_TYPE, range(self.geometry.n_nodes))
+        self.set_size = array(INDEX_TYPE, [1])*self.geometry.n_nodes
+        self.union_log = array(INDEX_TYPE)
+        self.history = []
+        occupied = self.get_occupied()
+        self.empty = [
+            pos for i, pos in enumerate(self.geometry.coords) 
+            if not (occupied >> i) & 1
+        ]
+        self.empty_index = array(INDEX_TYPE, [-1])*self.geometry.n_cells
+        for index, (y, x) in enumerate(self.empty):
+            self.empty_index[y*self.size + x] = index
+        for color in (HexBoard.BLUE, HexBoard.RED):
+            bits = self.bits[color]
+            for i in range(self.geometry.n_cells):
+                if (bits >> i) & 1:
+                    self._connect(i, color)
+        self.game_over = (
+            self.check_win(HexBoard.BLUE) or self.check_win(HexBoard.RED)
+        )
+        if self.distance_maps is not None:
+            self.distance_maps.reset()
 
     def check_win(self, color):
-        """Check if a player has won using dijsktra shortest path.
+        """Check if a player has won by comparing the roots of its edges.
         """
-        if dijkstra(self, color) == 0:
-            return True
-        else:
-            return False
+        start, end = self.geometry.edge_nodes[color]
+        return self._find(start) == self._find(end)
 
     def get_move_list(self):
-        """Return list of available moves"""
-        return [
-            tuple(x) for x in np.argwhere(self.board == HexBoard.EMPTY).tolist()
-        ]
+        """Return list of available moves.
+
+        The list is a copy of the maintained list of empty cells, so it can be
+        modified and iterated over while playing moves. Its order is not 
+        row-major once pieces have been placed.
+        """
+        return self.empty[:]
+
+    def get_move_count(self):
+        """Return the number of available moves."""
+        return len(self.empty)
+
+    def random_move(self):
+        """Return a uniformly sampled available move."""
+        return random.choice(self.empty)
 
     def print(self):
         """Print the board to console"""
-        board_string = ''
-        for y in range(self.size):
-            if y == 0:
-                board_string += '+  '
-                for x in range(self.size):
-                    board_string += str(x+1) + ' '
-                board_string += '\n'
-                board_string += (1+3*self.size)*'-'
-                board_string += '\n'
-            board_string += str(y+1)+'|'+y*' '
-            
-            for x in range(self.size):
-                board_string += ' '
-                if self.board[y,x] == HexBoard.BLUE:
-                    board_string += self.char_player1
-                elif self.board[y,x] == HexBoard.RED:
-                    board_string += self.char_player2
-                else: 
-                    board_string += self.char_empty
-            board_string += '\n'
-        board_string = board_string.strip()
-
-        print(board_string)
+        self.renderer.print(self)
     
     def hash_state(self):
         """Hash the board state.
+
+        Returns the incrementally updated Zobrist key of the position. The key
+        is a 64-bit unsigned integer that only depends on the position and 
+        board size, so it can be used directly as a table index or as a key 
+        in caches that outlive the board.
+        """
+        return self.key
+
+    def hash_move(self, move, color):
+        """Return the hash of the board state after playing `move` with 
+        `color`, without playing it.
         """
-        return hash(self.board.tostring())
+        i = move[0]*self.size + move[1]
+        return self.key ^ self.geometry.zobrist[color][i]
 
 
 def play_(opponent, board_size, level=3):
@@ -0,0 +1,124 @@
+import random
+
+BLUE = 1
+RED = 2
+EMPTY = 3
+
+# (dy, dx) offsets of the six neighbors of a cell.
+DIRECTIONS = ((-1, 0), (1, 0), (-1, 1), (1, -1), (0, 1), (0, -1))
+
+
+class HexGeometry:
+    """Size dependent lookup tables of a Hex board.
+
+    A position is stored as one bitset per color, where bit `y*size + x`
+    represents cell (y, x). The tables below only depend on the board size, so
+    they are built once and shared by all boards of that size, see
+    `HexGeometry.get`.
+    """
+    _cache = {}
+
+    def __init__(self, size):
+        """
+        Args:
+            size (int): Size of the board
+        """
+        self.size = size
+        self.n_cells = size*size
+        self.full_mask = (1 << self.n_cells) - 1
+
+        self.coords = [(i // size, i % size) for i in range(self.n_cells)]
+        self.neighbors = [
+            tuple(
+                (y+dy)*size + x+dx 
+                for dy, dx in DIRECTIONS
+                if 0 <= y+dy < size and 0 <= x+dx < size
+            )
+            for y, x in self.coords
+        ]
+
+        # Virtual source and sink node of every color, numbered after the 
+        # cells. Each color has its own adjacency table in which the virtual
+        # nodes are connected to the cells on the corresponding edge.
+        n = self.n_cells
+        self.n_nodes = n + 4
+        self.edge_nodes = {BLUE: (n, n+1), RED: (n+2, n+3)}
+        self.adjacency = {}
+        for color, on_edge in (
+            (BLUE, lambda y, x: (x == 0, x == size-1)),
+            (RED, lambda y, x: (y == 0, y == size-1)),
+        ):
+            source, sink = self.edge_nodes[color]
+            adjacency = [list(neighbors) for neighbors in self.neighbors]
+            adjacency += [[] for _ in range(4)]
+            for i, (y, x) in enumerate(self.coords):
+                on_source, on_sink = on_edge(y, x)
+                if on_source:
+                    adjacency[i].append(source)
+                    adjacency[source].append(i)
+                if on_sink:
+                    adjacency[i].append(sink)
+                    adjacency[sink].append(i)
+            self.adjacency[color] = [tuple(nodes) for nodes in adjacency]
+
+        col_first = sum(1 << (y*size) for y in range(size))
+        col_last = col_first << (size-1)
+        row_first = (1 << size) - 1
+        row_last = row_first << (size*(size-1))
+
+        # Cells that still have a neighbor to the left/right. Used to prevent
+        # shifted bits from wrapping around to the next row.
+        self.not_col_first = self.full_mask & ~col_first
+        self.not_col_last = self.full_mask & ~col_last
+
+        # Edges a color has to connect: BLUE plays horizontally, RED
+        # vertically.
+        self.edges = {
+            BLUE: (col_first, col_last),
+            RED: (row_first, row_last),
+        }
+
+        # Zobrist keys per color and cell. The generator is seeded with the 
+        # board size so keys are identical between processes and runs, which
+        # allows them to be used in persistent caches.
+        rng = random.Random(size)
+        self.zobrist = [
+            None,
+            [rng.getrandbits(64) for _ in range(self.n_cells)],
+            [rng.getrandbits(64) for _ in range(self.n_cells)],
+        ]
+
+    @classmethod
+    def get(cls, size):
+        """Return the (cached) geometry for a given board size.
+        """
+        geometry = cls._cache.get(size)
+        if geometry is None:
+            geometry = cls._cache[size] = cls(size)
+        return geometry
+
+    def dilate(self, bits):
+        """Grow a bitset by one step in all six hex directions.
+        """
+        n = self.size
+        left = bits & self.not_col_first
+        right = bits & self.not_col_last
+        return (
+            bits | (bits << n) | (bits >> n) | (right << 1) | (left >> 1) |
+            (right >> (n-1)) | (left << (n-1))
+        ) & self.full_mask
+
+    def connected(self, bits, color):
+        """Check whether the stones in `bits` connect both edges of `color`
+        using a shift based flood fill.
+        """
+        start, end = self.edges[color]
+        reach = bits & start
+        while reach:
+            if reach & end:
+                return True
+            grown = self.dilate(reach) & bits
+            if grown == reach:
+                return False
+            reach = grown
+        return False
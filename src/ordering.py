@@ -0,0 +1,105 @@
+from src.distances import DistanceMaps
+
+class MoveOrdering:
+    """Scored move ordering for the Alpha-Beta engines.
+
+    Moves are sorted on, in order of priority:
+        1. the best move stored in the transposition table
+        2. killer moves: moves that caused a cutoff at the same ply before,
+           two slots per ply
+        3. the history table: per color, the sum of depth^2 over all cutoffs
+           caused by a cell
+        4. optionally, the length of the shortest paths of both colors
+           through the cell, taken from the distance maps of the board (see
+           `distances.DistanceMaps`). Cells on or near the current shortest
+           paths come first.
+
+    The ply of a node is the number of pieces in the board history, so
+    killers are shared between nodes at the same level of the search tree.
+    One object keeps state for one search, robots should not share it.
+    """
+    n_killers = 2
+
+    def __init__(self, killers=True, history=True, distance=False):
+        """
+        Args:
+            killers (bool, optional): Use killer moves. Defaults to True.
+            history (bool, optional): Use the history table. Defaults to True.
+            distance (bool, optional): Order on shortest path distance. The
+                engines then keep distance maps on the searched board, which
+                adds a cost to every move played. Defaults to False.
+        """
+        self.use_killers = killers
+        self.use_history = history
+        self.use_distance = distance
+
+        self.killers = {}  # ply -> list of moves
+        self.history = {}  # color -> {move: score}
+
+    def reset(self):
+        """Prepare for the search of a next move: forget the killers and age
+        the history table.
+        """
+        self.killers = {}
+        for table in self.history.values():
+            for move in table:
+                table[move] //= 2
+
+    def order(self, board, moves, color, opponent, tt_move=None):
+        """Return `moves` sorted from most to least promising for `color`.
+
+        Args:
+            board (obj): game.HexBoard object
+            moves (list): moves to order
+            color (int): value of the player to move
+            opponent (int): value of the other player
+            tt_move (tuple, optional): best move from the transposition
+                table. Defaults to None.
+
+        Returns:
+            list: ordered moves
+        """
+        killers = ()
+        if self.use_killers:
+            killers = self.killers.get(len(board.history), ())
+        history = {}
+        if self.use_history:
+            history = self.history.get(color, {})
+        maps = None
+        if self.use_distance:
+            # The engines attach maps to the searched position. Outside a
+            # search, maps are computed for this call only.
+            maps = board.distance_maps or DistanceMaps(board)
+            size = board.size
+            limit = 2*board.geometry.n_cells
+
+        def score(move):
+            if move == tt_move:
+                tier = 0
+            elif move in killers:
+                tier = 1
+            else:
+                tier = 2
+            distance = 0
+            if maps is not None:
+                i = move[0]*size + move[1]
+                distance = (
+                    min(maps.path_distance(color, i), limit) +
+                    min(maps.path_distance(opponent, i), limit)
+                )
+            return tier, -history.get(move, 0), distance
+
+        return sorted(moves, key=score)
+
+    def update(self, board, move, color, depth):
+        """Register that `move` of `color` caused a cutoff in a node at
+        `depth`.
+        """
+        if self.use_killers:
+            killers = self.killers.setdefault(len(board.history), [])
+            if move not in killers:
+                killers.insert(0, move)
+                del killers[self.n_killers:]
+        if self.use_history:
+            table = self.history.setdefault(color, {})
+            table[move] = table.get(move, 0) + depth*depth
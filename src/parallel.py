@@ -0,0 +1,446 @@
+import multiprocessing as mp
+import queue
+import random
+import time
+import weakref
+
+import numpy as np
+
+from src.algorithms import (
+    TranspositionTablesAlphaBeta, MonteCarloTreeSearch, shortest_path_heuristic
+)
+from src.transposition import TranspositionTable
+from src.utils import SearchLimits
+
+# Depths skipped by the helper workers, as in the Lazy SMP of Stockfish:
+# helper i skips the depths where (depth + SKIP_PHASE[i]) // SKIP_SIZE[i] is
+# odd, so the helpers are spread over different depths.
+SKIP_SIZE = (1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 3, 3, 4, 4, 4, 4, 4, 4, 4, 4)
+SKIP_PHASE = (0, 1, 0, 1, 2, 3, 0, 1, 2, 3, 4, 5, 0, 1, 2, 3, 4, 5, 6, 7)
+
+def worker_depths(index, maxdepth):
+    """Return the depths searched by worker `index`. Worker 0 searches every
+    depth, the helpers skip depths according to SKIP_SIZE and SKIP_PHASE.
+    """
+    depths = range(1, maxdepth + 1)
+    if index == 0:
+        return list(depths)
+    helper = (index - 1) % len(SKIP_SIZE)
+    return [
+        depth for depth in depths 
+        if not (depth + SKIP_PHASE[helper]) // SKIP_SIZE[helper] % 2
+    ]
+
+class _WorkerAlphaBeta(TranspositionTablesAlphaBeta):
+    """TranspositionTablesAlphaBeta of a Lazy SMP worker. The root moves after
+    the first are searched in an order rotated by `shift`, so workers with
+    the same depths still start in different subtrees.
+    """
+    def __init__(self, shift=0, **options):
+        super().__init__(**options)
+        self.shift = shift
+        # Length of the board history at the root of the current search.
+        self.root_length = None
+
+    def get_moves(self, board, color, opponent, best_moves):
+        moves = super().get_moves(board, color, opponent, best_moves)
+        if len(board.history) == self.root_length and len(moves) > 2:
+            shift = self.shift % (len(moves) - 1)
+            moves = moves[:1] + moves[1+shift:] + moves[1:1+shift]
+        return moves
+
+def _search_worker(index, options, tt_name, tt_size, jobs, results, stop):
+    """Main loop of a Lazy SMP worker process. Runs iterative deepening for
+    every job and reports every completed depth.
+    """
+    tt = TranspositionTable(tt_size, name=tt_name)
+    limits = SearchLimits(maxtime=options['maxtime'], stop=stop)
+    engine = _WorkerAlphaBeta(
+        shift=index, tt=tt, limits=limits, **options
+    )
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        board, player, opponent, generation = job
+
+        engine.reset()
+        limits.start()
+        tt.generation = generation
+        engine.root_length = len(board.history)
+        maxdepth = min(engine.maxdepth, board.get_move_count())
+        depths = worker_depths(index, maxdepth)
+        for depth, move, g in engine.deepen(board, player, opponent, depths):
+            results.put((index, depth, move, g, None))
+        results.put((
+            index, None, None, None,
+            (engine.nodes_searched, engine.cutoffs, engine.tt_lookups)
+        ))
+    tt.close()
+
+def _mcts_worker(index, options, jobs, results, stop):
+    """Main loop of a root-parallel MCTS worker process. Searches every job
+    with its own tree and reports the statistics of the root children.
+    """
+    # Forked workers inherit the random state, reseed to get other trees.
+    random.seed()
+    np.random.seed()
+    limits = SearchLimits(
+        maxtime=options['maxtime'], maxiter=options['maxiter'], stop=stop
+    )
+    engine = MonteCarloTreeSearch(limits=limits, **options)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        board, player, opponent, deadline = job
+
+        # Search until the deadline of the main process, not a full maxtime
+        # after receiving the job.
+        limits.maxtime = max(deadline - time.time(), 0)
+        engine.search(board, player, opponent)
+        tree = engine.tree
+        children = tree.children(0)
+        results.put((
+            index, tree.move[children], tree.visits[children], 
+            tree.scores[children],
+            (engine.iterations, engine.playouts, tree.size, 
+             engine.reused_visits)
+        ))
+
+def _check_workers(processes, running):
+    """Raise a RuntimeError if one of the `running` workers has died, its
+    result will never come.
+    """
+    for index in running:
+        process = processes[index]
+        if not process.is_alive():
+            raise RuntimeError(
+                'Search worker {} stopped with exit code {}'.format(
+                    index, process.exitcode
+                )
+            )
+
+def _shutdown(processes, jobs, tt=None):
+    """Stop the worker processes and release the shared table."""
+    for job_queue in jobs:
+        job_queue.put(None)
+    for process in processes:
+        process.join(timeout=1)
+        if process.is_alive():
+            process.terminate()
+    if tt is not None:
+        tt.close()
+
+class LazySMPAlphaBeta:
+    """Parallel iterative deepening with Lazy SMP: several worker processes
+    search the same root with TranspositionTablesAlphaBeta, and share one
+    transposition table in shared memory (see
+    `transposition.TranspositionTable`). The first worker searches every
+    depth, the others skip depths following a per worker pattern (see
+    `worker_depths`) and search the root moves in a rotated order. So the 
+    workers search different parts of the tree and find each others results
+    in the table. The deepest completed result is returned. When the time is
+    up, the workers abort their current depth.
+
+    The worker processes are started at the first search and kept for the
+    next moves. They are stopped by `close`, or when the object is garbage
+    collected.
+    """
+    def __init__(self, workers=2, heuristic=shortest_path_heuristic, maxtime=5,
+                 maxdepth=9, tt_size=2**20, **options):
+        """
+        Args:
+            workers (int, optional): Number of worker processes. Defaults to
+                2.
+            heuristic (func, optional): Heuristic function. Defaults to
+                shortest_path_heuristic.
+            maxtime (int, optional): max time iterative deepening in seconds.
+                Defaults to 5.
+            maxdepth (int, optional): max depth iterative deepening. Defaults
+                to 9.
+            tt_size (int, optional): Number of entries of the shared
+                transposition table. Defaults to 2**20 (16 MB).
+            **options: Other options of TranspositionTablesAlphaBeta, used by
+                every worker.
+        """
+        self.workers = workers
+        self.heuristic = heuristic
+        self.maxtime = maxtime
+        self.maxdepth = maxdepth
+        self.options = dict(
+            heuristic=heuristic, maxtime=maxtime, maxdepth=maxdepth, **options
+        )
+
+        self.tt = TranspositionTable(tt_size, shared=True)
+        self.stop = mp.Event()
+        self.results = mp.Queue()
+        self.jobs = []
+        self.processes = []
+        self._finalizer = weakref.finalize(
+            self, _shutdown, self.processes, self.jobs, self.tt
+        )
+
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.nodes_searched = 0
+        self.cutoffs = 0
+        self.tt_lookups = 0
+        self.search_depth = 0
+        self.worker_depths = [0]*self.workers
+
+    def start(self):
+        """Start the worker processes."""
+        for index in range(self.workers):
+            jobs = mp.Queue()
+            process = mp.Process(
+                target=_search_worker,
+                args=(
+                    index, self.options, self.tt.name, self.tt.size, jobs,
+                    self.results, self.stop
+                ),
+                daemon=True
+            )
+            process.start()
+            self.jobs.append(jobs)
+            self.processes.append(process)
+
+    def close(self):
+        """Stop the worker processes and release the shared table."""
+        self._finalizer()
+
+    def reset(self):
+        self.tt.new_search()
+        self.reset_stats()
+
+    def iterative_deepening(self, board, player, opponent):
+        """Search the board with all workers.
+
+        Args:
+            board (obj): game.HexBoard object
+            player (int): value of player on board
+            opponent (int): value of opponent on board
+
+        Returns:
+            (tuple, int): best move and score of the deepest completed search,
+                the first move and None if no depth completed
+
+        Raises:
+            RuntimeError: A worker process died
+        """
+        if not self.processes:
+            self.start()
+        self.reset()
+        self.stop.clear()
+
+        job = (board, player, opponent, self.tt.generation)
+        for jobs in self.jobs:
+            jobs.put(job)
+
+        maxdepth = min(self.maxdepth, board.get_move_count())
+        deadline = time.time() + self.maxtime
+        # Without a completed depth, the first move is played.
+        best = (0, board.get_move_list()[:1], None)
+        running = set(range(self.workers))
+        while running:
+            try:
+                index, depth, move, g, stats = self.results.get(
+                    timeout=min(max(deadline - time.time(), 0.01), 1)
+                )
+            except queue.Empty:
+                if time.time() >= deadline:
+                    # Out of time, the workers abort their current depth.
+                    self.stop.set()
+                    _check_workers(self.processes, running)
+                continue
+
+            if depth is None:
+                running.discard(index)
+                nodes_searched, cutoffs, tt_lookups = stats
+                self.nodes_searched += nodes_searched
+                self.cutoffs += cutoffs
+                self.tt_lookups += tt_lookups
+                continue
+
+            self.worker_depths[index] = depth
+            if depth > best[0]:
+                best = (depth, move, g)
+            if depth >= maxdepth:
+                self.stop.set()
+
+        self.search_depth, move, g = best
+        return move, g
+
+    def print_summary(self):
+        """print summary of search.
+        """
+        summary_txt = (
+            '\n'
+            'SUMMARY OF MOVE TAKING PROCESS:\n'
+            '-----------------------------------------------------'+'\n'
+            'Workers:                     | {workers}\n'
+            'Search depth:                | {depth}\n'
+            'Depth per worker:            | {worker_depths}\n'
+            'Nodes searched:              | {nodes_searched}\n'
+            'Alpha-Beta pruning cutoffs:  | {cutoffs}\n'
+            'Transposition table lookups: | {tt_lookups}\n'
+            'Transposition table usage:   | {tt_usage:.1%}\n'
+            '-----------------------------------------------------\n'
+        )
+        print(
+            summary_txt.format(
+                workers=self.workers,
+                depth=self.search_depth,
+                worker_depths=self.worker_depths,
+                nodes_searched=self.nodes_searched,
+                cutoffs=self.cutoffs,
+                tt_lookups=self.tt_lookups,
+                tt_usage=self.tt.usage(),
+            )
+        )
+
+class RootParallelMCTS:
+    """Root-parallel Monte Carlo Tree Search: several worker processes search
+    the same root with their own MonteCarloTreeSearch tree until the same
+    deadline. The visits and scores of the root children are summed over the
+    workers, and the most visited move is played.
+
+    Like LazySMPAlphaBeta, the worker processes are kept for the next moves,
+    so every worker also keeps reusing its own subtree. They are stopped by
+    `close`, or when the object is garbage collected.
+    """
+    def __init__(self, workers=2, maxiter=1000, maxtime=5, cp=1, **options):
+        """
+        Args:
+            workers (int, optional): Number of worker processes. Defaults to
+                2.
+            maxiter (int, optional): Maximum number of iterations per worker.
+                Defaults to 1000.
+            maxtime (int, optional): Maximum time in seconds. Defaults to 5.
+            cp (int, optional): Cp parameter for MCTS algorithm. Defaults to 1.
+            **options: Other options of MonteCarloTreeSearch, used by every
+                worker.
+
+        Raises:
+            ValueError: Invalid options, see MonteCarloTreeSearch
+        """
+        self.workers = workers
+        self.maxiter = maxiter
+        self.maxtime = maxtime
+        self.cp = cp
+        self.options = dict(maxiter=maxiter, maxtime=maxtime, cp=cp, **options)
+        # Fail on invalid options here rather than in the workers.
+        MonteCarloTreeSearch(**self.options)
+
+        self.stop = mp.Event()
+        self.results = mp.Queue()
+        self.jobs = []
+        self.processes = []
+        self._finalizer = weakref.finalize(
+            self, _shutdown, self.processes, self.jobs
+        )
+
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.iterations = 0
+        self.playouts = 0
+        self.reused_visits = 0
+        self.tree_sizes = [0]*self.workers
+
+    def start(self):
+        """Start the worker processes."""
+        for index in range(self.workers):
+            jobs = mp.Queue()
+            process = mp.Process(
+                target=_mcts_worker,
+                args=(index, self.options, jobs, self.results, self.stop),
+                daemon=True
+            )
+            process.start()
+            self.jobs.append(jobs)
+            self.processes.append(process)
+
+    def close(self):
+        """Stop the worker processes."""
+        self._finalizer()
+
+    def search(self, board, player_to_move, opponent):
+        """Find the best move for a player given a board state.
+
+        Args:
+            board (obj): game.HexBoard object
+            player (int): value of player on board
+            opponent (int): value of opponent on board
+
+        Returns:
+            tuple: best move
+
+        Raises:
+            RuntimeError: A worker process died
+        """
+        if not self.processes:
+            self.start()
+        self.reset_stats()
+        self.stop.clear()
+
+        deadline = time.time() + self.maxtime
+        for jobs in self.jobs:
+            jobs.put((board, player_to_move, opponent, deadline))
+
+        n_cells = board.size*board.size
+        visits = np.zeros(n_cells)
+        scores = np.zeros(n_cells)
+        running = set(range(self.workers))
+        while running:
+            try:
+                index, moves, child_visits, child_scores, stats = (
+                    self.results.get(
+                        timeout=min(max(deadline - time.time(), 0.01), 1)
+                    )
+                )
+            except queue.Empty:
+                if time.time() >= deadline:
+                    # Out of time, the workers stop after this iteration.
+                    self.stop.set()
+                    _check_workers(self.processes, running)
+                continue
+
+            running.discard(index)
+            np.add.at(visits, moves, child_visits)
+            np.add.at(scores, moves, child_scores)
+            iterations, playouts, tree_size, reused_visits = stats
+            self.iterations += iterations
+            self.playouts += playouts
+            self.reused_visits += reused_visits
+            self.tree_sizes[index] = tree_size
+
+        if not visits.any():  # No iteration within the limits
+            return board.get_move_list()[0]
+        return divmod(int(np.argmax(visits)), board.size)
+
+    def print_summary(self):
+        """print summary of search.
+        """
+        summary_txt = (
+            '\n'
+            'SUMMARY OF MOVE TAKING PROCESS:\n'
+            '-----------------------------------------------------'+'\n'
+            'Workers                      | {workers}\n'
+            'Search tree size per worker  | {tree_sizes}\n'
+            'Iterations                   | {iterations}\n'
+            'Playouts                     | {playouts}\n'
+            'Reused visits                | {reused_visits:.0f}\n'
+            '-----------------------------------------------------'
+        )
+
+        print(
+            summary_txt.format(
+                workers=self.workers,
+                tree_sizes=self.tree_sizes,
+                iterations=self.iterations,
+                playouts=self.playouts,
+                reused_visits=self.reused_visits,
+            )
+        )
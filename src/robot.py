@@ -1,19 +1,33 @@
 
 import time
-import numpy as np
 
 from src.algorithms import (
-    AlphaBeta, TranspositionTablesAlphaBeta, MonteCarloTreeSearch
+    AlphaBeta, TranspositionTablesAlphaBeta, MonteCarloTreeSearch,
+    shortest_path_heuristic
 )
+from src.parallel import LazySMPAlphaBeta, RootParallelMCTS
+from src.utils import EvaluationCache, SearchLimits
 
 class HexRobot:
     """Hex robot object.
+
+    With a 'maxtime' keyword argument, `make_move` returns within that time:
+    the engines abort their search at a deadline `time_margin` seconds 
+    before it and play the best move found so far. 'maxnodes' limits the 
+    number of searched nodes of the Alpha-Beta engines.
     """
+    # Time reserved for aborting the search and placing the piece.
+    time_margin = 0.005
+
     def __init__(self, algorithm, robot_color, opponent_color, **kwargs):
         """
         Args:
             algorithm (str): Robot algortihm. options: 'alpha-beta', 
-                'alpha-beta-iterative-deepening', 'mcts' and 'random'.
+                'alpha-beta-iterative-deepening', 'alpha-beta-mtdf', 'mcts' 
+                and 'random'. 'alpha-beta-mtdf' is iterative deepening with
+                MTD(f) at every depth.
+                'alpha-beta-iterative-deepening' and 'mcts' search in 
+                parallel with the keyword argument 'workers' > 1.
             robot_color (int): value of robot on board
             opponent_color (int): value of opponent on board
 
@@ -27,18 +41,35 @@ class HexRobot:
 
         if self.algorithm == 'alpha-beta':
             self.alpha_beta_search_depth = kwargs.get('depth')
-            self.heuristic = kwargs.get('heuristic')
+            self.heuristic = self.get_heuristic(kwargs)
             
             if not self.alpha_beta_search_depth:
                 self.alpha_beta_search_depth = 4
+
+            # Without limits, the search always completes its depth.
+            self.limits = None
+            if kwargs.get('maxtime') or kwargs.get('maxnodes'):
+                self.limits = self.get_limits(
+                    kwargs.get('maxtime'), kwargs.get('maxnodes')
+                )
             
             if self.heuristic:
-                self.engine = AlphaBeta(heuristic=self.heuristic)
+                self.engine = AlphaBeta(
+                    heuristic=self.heuristic, 
+                    frontier_batch=kwargs.get('frontier_batch'),
+                    ordering=kwargs.get('ordering'),
+                    limits=self.limits
+                )
             else:
-                self.engine = AlphaBeta()
+                self.engine = AlphaBeta(
+                    frontier_batch=kwargs.get('frontier_batch'),
+                    ordering=kwargs.get('ordering'),
+                    limits=self.limits
+                )
 
-        elif algorithm == 'alpha-beta-iterative-deepening':
-            self.heuristic = kwargs.get('heuristic')
+        elif algorithm in (
+                'alpha-beta-iterative-deepening', 'alpha-beta-mtdf'):
+            self.heuristic = self.get_heuristic(kwargs)
             self.maxdepth = kwargs.get('maxdepth')
             self.maxtime = kwargs.get('maxtime')
 
@@ -48,16 +79,31 @@ class HexRobot:
             if not self.maxtime:
                 self.maxtime = 2.5
 
+            options = dict(
+                maxtime=self.maxtime, 
+                maxdepth=self.maxdepth,
+                frontier_batch=kwargs.get('frontier_batch'),
+                pvs=kwargs.get('pvs', False),
+                aspiration_window=kwargs.get('aspiration_window'),
+                ordering=kwargs.get('ordering'),
+                mtdf=algorithm == 'alpha-beta-mtdf',
+            )
             if self.heuristic:
-                self.engine = TranspositionTablesAlphaBeta(
-                    heuristic=self.heuristic, 
-                    maxtime=self.maxtime, 
-                    maxdepth=self.maxdepth
-                )
+                options['heuristic'] = self.heuristic
+            if kwargs.get('tt_size'):
+                options['tt_size'] = kwargs.get('tt_size')
+
+            # Lazy SMP over worker processes sharing the transposition table
+            self.workers = kwargs.get('workers') or 1
+            if self.workers > 1:
+                options['maxtime'] = self.get_limits(self.maxtime).maxtime
+                self.engine = LazySMPAlphaBeta(workers=self.workers, **options)
+                # Start the workers now, so that does not take move time.
+                self.engine.start()
             else:
                 self.engine = TranspositionTablesAlphaBeta(
-                    maxtime=self.maxtime, 
-                    maxdepth=self.maxdepth
+                    limits=self.get_limits(self.maxtime, kwargs.get('maxnodes')),
+                    **options
                 )
 
         elif self.algorithm == 'mcts':
@@ -72,18 +118,65 @@ class HexRobot:
             if not self.cp:
                 self.cp = 1
 
-            self.engine = MonteCarloTreeSearch(
-                self.maxiter, 
-                self.maxtime,
-                self.cp
+            options = dict(
+                rollout=kwargs.get('rollout', 'fill'),
+                batch_size=kwargs.get('batch_size') or 1,
+                reuse_tree=kwargs.get('reuse_tree', True)
             )
 
+            # Root parallel search over worker processes
+            self.workers = kwargs.get('workers') or 1
+            if self.workers > 1:
+                self.engine = RootParallelMCTS(
+                    workers=self.workers,
+                    maxiter=self.maxiter,
+                    maxtime=self.get_limits(self.maxtime).maxtime,
+                    cp=self.cp,
+                    **options
+                )
+                # Start the workers now, so that does not take move time.
+                self.engine.start()
+            else:
+                self.engine = MonteCarloTreeSearch(
+                    self.maxiter, 
+                    self.maxtime,
+                    self.cp,
+                    limits=SearchLimits(
+                        maxtime=self.get_limits(self.maxtime).maxtime, 
+                        maxiter=self.maxiter
+                    ),
+                    **options
+                )
+
         elif self.algorithm == 'random':
             pass
 
         else:
             raise ValueError('Unknown algorithm "{}"'.format(algorithm))
 
+    def get_limits(self, maxtime, maxnodes=None):
+        """Get the search limits for a move time of `maxtime` seconds and a 
+        budget of `maxnodes` nodes.
+        """
+        if maxtime:
+            maxtime = max(maxtime - self.time_margin, 0)
+        return SearchLimits(maxtime=maxtime, maxnodes=maxnodes)
+
+    def get_heuristic(self, kwargs):
+        """Get the heuristic from the keyword arguments. If 'eval_cache' is 
+        given, either as maximum number of entries or as an EvaluationCache to 
+        share between robots, the heuristic is put behind that cache.
+        """
+        heuristic = kwargs.get('heuristic')
+        eval_cache = kwargs.get('eval_cache')
+        if eval_cache is None:
+            return heuristic
+        if not isinstance(eval_cache, EvaluationCache):
+            eval_cache = EvaluationCache(
+                heuristic or shortest_path_heuristic, max_entries=eval_cache
+            )
+        return eval_cache
+
     def best_move_mcts(self, board):
         """ Calculate best move according to MCTS algorithm.
         """
@@ -97,7 +190,15 @@ class HexRobot:
     def best_move_alphabeta(self, board):
         """ Calculate best move according to Alpha-Beta algorithm.
         """
-        empty_spaces = len(board.get_move_list())
+        empty_spaces = board.get_move_count()
+        if self.limits is not None:
+            move, _ = self.engine.iterative_deepening(
+                board, 
+                self.robot_color,
+                self.opponent_color,
+                depth=self.alpha_beta_search_depth
+            )
+            return move
         move, _ = self.engine.search(
             board, 
             self.robot_color,
@@ -120,9 +221,7 @@ class HexRobot:
     def random_move(self, board):
         """Generate a random move.
         """
-        movelist = board.get_move_list()
-        idx_move = np.random.randint(len(movelist))
-        return movelist[idx_move]
+        return board.random_move()
 
     def make_move(self, board):
         """ Generate a move and place on the board.
@@ -131,7 +230,8 @@ class HexRobot:
         
         if self.algorithm == 'alpha-beta':
             move = self.best_move_alphabeta(board)
-        if self.algorithm == 'alpha-beta-iterative-deepening':
+        if self.algorithm in (
+                'alpha-beta-iterative-deepening', 'alpha-beta-mtdf'):
             move = self.best_move_alphabeta_iterative_deepening(board)
         elif self.algorithm == 'mcts':
             move = self.best_move_mcts(board)
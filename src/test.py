@@ -1,16 +1,16 @@
-import sys
-
 from src.game import HexBoard
 from src.algorithms import (
     dijkstra, TranspositionTablesAlphaBeta, AlphaBeta
 )
 from src.robot import HexRobot
+from src.batch import HexBoardBatch
 
 def test_boarder():
     board = HexBoard(size=3)
 
-    for i in board.get_neighbors((0, -sys.maxsize)):
-        board.set_piece(i, board.RED)
+    source, _ = board.geometry.edge_nodes[board.BLUE]
+    for i in board.geometry.adjacency[board.BLUE][source]:
+        board.set_piece(board.geometry.coords[i], board.RED)
 
     board.print()
 
@@ -103,6 +103,34 @@ def test_win():
     print(board.is_game_over())
 
 
+def test_undo():
+    board = HexBoard(size=4)
+
+    board.set_piece((0,0), board.RED)
+    board.set_piece((1,0), board.RED)
+    board.set_piece((2,0), board.RED)
+    board.print()
+
+    board.play((3,0), board.RED)
+    board.print()
+    print(board.is_game_over())
+
+    board.undo()
+    board.print()
+    print(board.is_game_over())
+
+
+def test_batch():
+    board = HexBoard(size=3)
+    batch = HexBoardBatch.from_board(board, 3)
+
+    for i in range(3):
+        batch.set_pieces([(i, 0), (0, i), (i, i)], board.BLUE)
+
+    print(batch.cells)
+    print(batch.winners())
+
+
 def test_alphabeta():
     board = HexBoard(size=4)
 
@@ -276,6 +304,8 @@ if __name__ == '__main__':
     # test_dijkstra()
     # test_neighbors()
     # test_win()
+    # test_undo()
+    # test_batch()
     # test_alphabeta()
     # test_tt_alphabeta()
     # test_iterative_deepening()
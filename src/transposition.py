@@ -0,0 +1,188 @@
+from multiprocessing import shared_memory
+import random
+import sys
+
+import numpy as np
+
+# Entry flags
+LEAF = 1
+LOWERBOUND = 2
+UPPERBOUND = 3
+
+# Layout of the packed 64-bit data word of an entry.
+FLAG_BITS, DEPTH_BITS, GENERATION_BITS, MOVE_BITS, VALUE_BITS = 2, 8, 8, 16, 30
+DEPTH_SHIFT = FLAG_BITS
+GENERATION_SHIFT = DEPTH_SHIFT + DEPTH_BITS
+MOVE_SHIFT = GENERATION_SHIFT + GENERATION_BITS
+VALUE_SHIFT = MOVE_SHIFT + MOVE_BITS
+
+NO_MOVE = (1 << MOVE_BITS) - 1
+VALUE_OFFSET = 1 << (VALUE_BITS - 1)
+# Values beyond this magnitude (the infinite bounds of the search window) are
+# stored as +/- VALUE_MAX and read back as +/- sys.maxsize.
+VALUE_MAX = VALUE_OFFSET - 1
+
+class TranspositionTable:
+    """Fixed-capacity transposition table backed by two NumPy uint64 arrays,
+    one with keys and one with packed entries (flag, depth, generation, best
+    move and value).
+
+    A key maps to a bucket of two slots. The first slot is depth-preferred:
+    it is only overwritten by a search of at least the same depth, or when
+    its entry is from an older generation. Other entries go to the second
+    slot, which is always replaced. The generation is increased for every new
+    search, so the table can be kept for a whole game without stale deep
+    entries taking up the depth-preferred slots.
+
+    The stored values depend on the player the heuristic scores for and on
+    the side to move, so both are mixed into the key, see `state_key`.
+
+    The arrays can live in shared memory, so several processes can search
+    with one table. There are no locks: a slot stores the key XOR the data,
+    and an entry is only used when the data it is read with gives back the
+    key. An entry torn by two simultaneous writes is then ignored, so the 
+    table is lossy but never returns wrong data.
+    """
+    def __init__(self, size=2**18, shared=False, name=None):
+        """
+        Args:
+            size (int, optional): Number of entries, rounded down to a power
+                of two. The table takes 16 bytes per entry. Defaults to 2**18.
+            shared (bool, optional): Create the table in shared memory. 
+                Defaults to False.
+            name (str, optional): Attach to the shared memory table with this
+                name, created by another process with the same size. 
+                Defaults to None.
+        """
+        n_buckets = 1 << max(int(size).bit_length() - 2, 0)
+        self.size = 2*n_buckets
+        self.mask = n_buckets - 1
+        self.generation = 0
+
+        self.shm = None
+        self.owner = False
+        if shared or name is not None:
+            self.shm = shared_memory.SharedMemory(
+                name=name, create=name is None, size=16*self.size
+            )
+            self.owner = name is None
+            self.keys = np.ndarray(
+                self.size, dtype=np.uint64, buffer=self.shm.buf
+            )
+            self.data = np.ndarray(
+                self.size, dtype=np.uint64, buffer=self.shm.buf, 
+                offset=8*self.size
+            )
+            if self.owner:
+                self.clear()
+        else:
+            self.keys = np.zeros(self.size, dtype=np.uint64)
+            self.data = np.zeros(self.size, dtype=np.uint64)
+
+        rng = random.Random('transposition')
+        self.side_keys = {
+            (color, maximize): rng.getrandbits(64)
+            for color in (1, 2) for maximize in (True, False)
+        }
+
+    def state_key(self, key, player, maximize):
+        """Return the table key of a position with board hash `key`, searched
+        for `player` with the player to move if `maximize`.
+        """
+        return key ^ self.side_keys[(player, maximize)]
+
+    def new_search(self):
+        """Start a new generation, entries of older generations are replaced
+        first.
+        """
+        self.generation = (self.generation + 1) % (1 << GENERATION_BITS)
+
+    @property
+    def name(self):
+        """Name of the shared memory block, None if the table is not 
+        shared.
+        """
+        return None if self.shm is None else self.shm.name
+
+    def clear(self):
+        self.keys[:] = 0
+        self.data[:] = 0
+
+    def close(self):
+        """Release the shared memory, which is removed when the process that
+        created it closes the table.
+        """
+        if self.shm is None:
+            return
+        self.keys = self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+    def usage(self):
+        """Return the fraction of slots in use."""
+        return np.count_nonzero(self.data)/self.size
+
+    def get(self, state_key):
+        """Return the entry of a key as (move, depth, value, flag), or None if
+        the key is not in the table.
+        """
+        slot = (state_key & self.mask) << 1
+        for i in (slot, slot + 1):
+            data = int(self.data[i])
+            if data and int(self.keys[i]) ^ data == state_key:
+                return self.unpack(data)
+        return None
+
+    def put(self, state_key, move, depth, value, flag):
+        """Store an entry, see the class description for the replacement
+        policy.
+
+        Args:
+            state_key (int): key from `state_key`
+            move (tuple): best move, None if there is none
+            depth (int): search depth of the entry
+            value (int): score or bound
+            flag (int): LEAF, LOWERBOUND or UPPERBOUND
+        """
+        slot = (state_key & self.mask) << 1
+        old = int(self.data[slot])
+        if old and int(self.keys[slot]) ^ old != state_key:
+            old_depth = (old >> DEPTH_SHIFT) & ((1 << DEPTH_BITS) - 1)
+            old_generation = (
+                (old >> GENERATION_SHIFT) & ((1 << GENERATION_BITS) - 1)
+            )
+            if depth < old_depth and old_generation == self.generation:
+                slot += 1
+        data = self.pack(move, depth, value, flag)
+        self.keys[slot] = state_key ^ data
+        self.data[slot] = data
+
+    def pack(self, move, depth, value, flag):
+        """Pack an entry in a 64-bit integer, which is never 0."""
+        if move is None:
+            move = NO_MOVE
+        else:
+            move = (move[0] << 8) | move[1]
+        value = max(-VALUE_MAX, min(value, VALUE_MAX)) + VALUE_OFFSET
+        return (
+            flag |
+            min(depth, (1 << DEPTH_BITS) - 1) << DEPTH_SHIFT |
+            self.generation << GENERATION_SHIFT |
+            move << MOVE_SHIFT |
+            value << VALUE_SHIFT
+        )
+
+    def unpack(self, data):
+        """Unpack an entry packed by `pack`, see `get`."""
+        flag = data & ((1 << FLAG_BITS) - 1)
+        depth = (data >> DEPTH_SHIFT) & ((1 << DEPTH_BITS) - 1)
+        move = (data >> MOVE_SHIFT) & NO_MOVE
+        move = None if move == NO_MOVE else (move >> 8, move & 0xff)
+        value = (data >> VALUE_SHIFT) - VALUE_OFFSET
+        if value >= VALUE_MAX:
+            value = sys.maxsize
+        elif value <= -VALUE_MAX:
+            value = -sys.maxsize
+        return move, depth, value, flag
@@ -1,61 +1,299 @@
-from functools import wraps
-import errno
-import os
-import signal
- 
-################################################################################
-#                                                                              #
-# Source: https://stackoverflow.com/questions/31822190/how-does-the-timeouttimelimit-decorator-work
-#                                                                              #
-################################################################################
-
-class TimeoutError(Exception):
+from collections import OrderedDict
+import sys
+import time
+
+import numpy as np
+
+class SearchAborted(Exception):
+    """Raised inside a search when its SearchLimits are exceeded."""
     pass
- 
-def timeout(seconds=10, error_message=os.strerror(errno.ETIME)):
-    def decorator(func):
-        def _handle_timeout(signum, frame):
-            raise TimeoutError(error_message)
- 
-        def wrapper(*args, **kwargs):
-            signal.signal(signal.SIGALRM, _handle_timeout)
-            signal.alarm(seconds)
-            try:
-                result = func(*args, **kwargs)
-            finally:
-                signal.alarm(0)
-            return result
- 
-        return wraps(func)(wrapper)
- 
-    return decorator
-
-################################################################################
-
-class Node:
-    """Game tree node object"""
-    def __init__(self, player_to_move, move=None, parent=None):
-        self.move = move
-        self.parent = parent
-        self.player_to_move = player_to_move
-
-        self.visited = 0
-        self.score = 0
-
-        self.children = []
-    
-    def add_child(self, child):
-        """Add a child node to the node
 
+class SearchLimits:
+    """Budget of a search: a wall-clock deadline, a number of nodes and a 
+    number of iterations (depths of iterative deepening, or MCTS playouts).
+
+    The engines check the limits cooperatively: `check` is called for every
+    searched node and raises SearchAborted when the budget is spent, so a
+    search stops within the time of a single node evaluation. Iterative
+    engines call `exceeded` between iterations instead. An optional stop
+    event, e.g. a multiprocessing.Event, aborts the search from outside.
+    """
+    def __init__(self, maxtime=None, maxnodes=None, maxiter=None, stop=None):
+        """
+        Args:
+            maxtime (float, optional): Maximum time in seconds. Defaults to 
+                None (no limit).
+            maxnodes (int, optional): Maximum number of nodes. Defaults to 
+                None (no limit).
+            maxiter (int, optional): Maximum number of iterations. Defaults to
+                None (no limit).
+            stop (obj, optional): Event that aborts the search when set. 
+                Defaults to None.
+        """
+        self.maxtime = maxtime
+        self.maxnodes = maxnodes
+        self.maxiter = maxiter
+        self.stop = stop
+        self.start()
+
+    def start(self):
+        """Start the budget, called by the engines when a search starts."""
+        self.t_start = time.perf_counter()
+        self.deadline = None
+        if self.maxtime is not None:
+            self.deadline = self.t_start + self.maxtime
+        self.nodes = 0
+        self.iterations = 0
+
+    def elapsed(self):
+        """Return the time since the start in seconds."""
+        return time.perf_counter() - self.t_start
+
+    def remaining(self):
+        """Return the time left in seconds, inf if there is no deadline."""
+        if self.deadline is None:
+            return float('inf')
+        return self.deadline - time.perf_counter()
+
+    def exceeded(self):
+        """Check whether any of the limits is exceeded."""
+        return (
+            (self.maxnodes is not None and self.nodes > self.maxnodes) or
+            (self.maxiter is not None and self.iterations >= self.maxiter) or
+            (self.deadline is not None and 
+             time.perf_counter() >= self.deadline) or
+            (self.stop is not None and self.stop.is_set())
+        )
+
+    def check(self):
+        """Count a searched node.
+
+        Raises:
+            SearchAborted: A limit is exceeded.
+        """
+        self.nodes += 1
+        if self.exceeded():
+            raise SearchAborted
+
+    def iteration(self):
+        """Count a completed iteration."""
+        self.iterations += 1
+
+class SearchTree:
+    """Game tree stored as a struct of arrays, used by MCTS. 
+
+    Nodes are indices into preallocated NumPy arrays, which grow in chunks.
+    The children of a node are allocated together when the node is expanded,
+    so they form the slice [first_child, first_child + n_children) and the
+    statistics of all children can be processed at once. Children are tried
+    in the order they were added: the first n_tried of them have been 
+    visited. Node 0 is the root.
+    """
+    chunk_size = 2**16
+
+    def __init__(self, capacity=chunk_size):
+        """
+        Args:
+            capacity (int, optional): Number of nodes to allocate initially.
+                Defaults to chunk_size.
+        """
+        self.capacity = 0
+        self.visits = np.zeros(0)
+        self.scores = np.zeros(0)
+        self.parent = np.zeros(0, dtype=np.int32)
+        self.move = np.zeros(0, dtype=np.int32)
+        self.first_child = np.zeros(0, dtype=np.int32)
+        self.n_children = np.zeros(0, dtype=np.int32)
+        self.n_tried = np.zeros(0, dtype=np.int32)
+        self.grow(capacity)
+
+        # The root, without parent and move.
+        self.size = 1
+        self.parent[0] = -1
+        self.move[0] = -1
+
+    def grow(self, capacity):
+        """Grow the arrays to at least `capacity` nodes, in whole chunks."""
+        if capacity <= self.capacity:
+            return
+        n_chunks = -(-capacity // self.chunk_size)
+        capacity = n_chunks*self.chunk_size
+        extra = capacity - self.capacity
+        self.visits = np.concatenate([self.visits, np.zeros(extra)])
+        self.scores = np.concatenate([self.scores, np.zeros(extra)])
+        self.parent = np.concatenate(
+            [self.parent, np.full(extra, -1, dtype=np.int32)]
+        )
+        self.move = np.concatenate(
+            [self.move, np.full(extra, -1, dtype=np.int32)]
+        )
+        self.first_child = np.concatenate(
+            [self.first_child, np.full(extra, -1, dtype=np.int32)]
+        )
+        self.n_children = np.concatenate(
+            [self.n_children, np.zeros(extra, dtype=np.int32)]
+        )
+        self.n_tried = np.concatenate(
+            [self.n_tried, np.zeros(extra, dtype=np.int32)]
+        )
+        self.capacity = capacity
+
+    def is_expanded(self, node):
+        return self.first_child[node] >= 0
+
+    def expand(self, node, moves):
+        """Add the children of a node.
+
+        Args:
+            node (int): node to expand
+            moves (list): moves leading to the children, as cell indices
+        """
+        first = self.size
+        self.size += len(moves)
+        self.grow(self.size)
+        self.parent[first:self.size] = node
+        self.move[first:self.size] = moves
+        self.first_child[node] = first
+        self.n_children[node] = len(moves)
+
+    def children(self, node):
+        """Return the slice of the children of a node."""
+        first = self.first_child[node]
+        return slice(first, first + self.n_children[node])
+
+    def try_child(self, node):
+        """Return the next untried child of a node and mark it as tried, or
+        None if all children have been tried.
+        """
+        n_tried = self.n_tried[node]
+        if n_tried == self.n_children[node]:
+            return None
+        self.n_tried[node] = n_tried + 1
+        return self.first_child[node] + n_tried
+
+    def subtree(self, node):
+        """Return a new SearchTree holding the subtree below `node`, with
+        `node` as its root. The nodes are renumbered level by level, which 
+        keeps every block of children contiguous.
+        """
+        levels = [np.array([node])]
+        while True:
+            nodes = levels[-1]
+            nodes = nodes[self.n_children[nodes] > 0]
+            if not len(nodes):
+                break
+            starts = self.first_child[nodes]
+            counts = self.n_children[nodes]
+            offsets = np.cumsum(counts) - counts
+            levels.append(
+                np.arange(counts.sum()) + np.repeat(starts - offsets, counts)
+            )
+        order = np.concatenate(levels)
+
+        tree = SearchTree(len(order))
+        tree.size = len(order)
+        index = np.full(self.size, -1, dtype=np.int32)
+        index[order] = np.arange(len(order))
+        tree.visits[:tree.size] = self.visits[order]
+        tree.scores[:tree.size] = self.scores[order]
+        tree.move[:tree.size] = self.move[order]
+        tree.n_children[:tree.size] = self.n_children[order]
+        tree.n_tried[:tree.size] = self.n_tried[order]
+        first_child = self.first_child[order]
+        has_children = tree.n_children[:tree.size] > 0
+        # Expanded nodes without children (full boards) point past the end.
+        tree.first_child[:tree.size][first_child >= 0] = tree.size
+        tree.first_child[:tree.size][has_children] = (
+            index[first_child[has_children]]
+        )
+        tree.parent[1:tree.size] = index[self.parent[order[1:]]]
+        tree.parent[0] = -1
+        tree.move[0] = -1
+        return tree
+
+    def backpropagate(self, node, result, weight=1):
+        """Add `weight` visits with mean `result` to a node and all its 
+        ancestors.
+        """
+        visits, scores, parent = self.visits, self.scores, self.parent
+        while node >= 0:
+            visits[node] += weight
+            scores[node] += result*weight
+            node = parent[node]
+
+class EvaluationCache:
+    """Bounded least recently used cache in front of a heuristic.
+
+    Can be passed as heuristic to the search engines. Positions are keyed by
+    their Zobrist hash, board size and players, so a cache can be shared
+    between engines and games as long as they use the same heuristic.
+    """
+    # Rough memory use of an OrderedDict entry on top of key and value.
+    entry_overhead = 100
+
+    def __init__(self, heuristic, max_entries=2**20, max_bytes=None, 
+                 persistent=True):
+        """
         Args:
-            child (obj): Node object
+            heuristic (func): Heuristic function to cache
+            max_entries (int, optional): Maximum number of cached evaluations.
+                Defaults to 2**20.
+            max_bytes (int, optional): Approximate maximum memory use in 
+                bytes. Defaults to None (no limit).
+            persistent (bool, optional): If false, engines clear the cache 
+                when they are reset, i.e. before every move of iterative 
+                deepening. Defaults to True.
+        """
+        self.heuristic = heuristic
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.persistent = persistent
+
+        self.cache = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, board, player, opponent):
+        key = (board.hash_state(), board.size, player, opponent)
+        value = self.cache.get(key)
+        if value is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = self.heuristic(board, player=player, opponent=opponent)
+        self.cache[key] = value
+        self.nbytes += self.entry_size(key, value)
+
+        while (len(self.cache) > self.max_entries or 
+               (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+            old_key, old_value = self.cache.popitem(last=False)
+            self.nbytes -= self.entry_size(old_key, old_value)
+        return value
+
+    def entry_size(self, key, value):
+        """Approximate memory use of a cache entry in bytes."""
+        return (
+            sys.getsizeof(key) + sum(sys.getsizeof(k) for k in key) + 
+            sys.getsizeof(value) + self.entry_overhead
+        )
+
+    def clear(self):
+        """Remove all entries."""
+        self.cache.clear()
+        self.nbytes = 0
+
+    def reset(self):
+        """Called by the engines on reset. Clears the cache unless it is 
+        persistent.
         """
-        self.children.append(child)
-    
-    def is_fully_expanded(self):
-        """Check if node is fully expanded.
+        if not self.persistent:
+            self.clear()
+
+    def hit_rate(self):
+        """Return the fraction of lookups that were answered from the cache.
         """
-        if self.children and all(c.visited>0 for c in self.children):
-            return True
-        else:
-            return False
\ No newline at end of file
+        lookups = self.hits + self.misses
+        return self.hits/lookups if lookups else 0.